@@ -0,0 +1,557 @@
+# -------------------------
+# tSF Benchmark
+# -------------------------
+# Generates synthetic tSF missions, serves them from local HTTP stand-in and times
+# ReviewHelper and MissionDownloader stages. Results are saved to JSON to compare versions.
+
+import argparse
+import contextlib
+import hashlib
+import http.server
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from zipfile import ZipFile, ZIP_DEFLATED
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REVIEW_HELPER_PATH = os.path.join(ROOT_DIR, "ReviewHelper", "tSF_ReviewHelper_v0.2.py")
+MISSION_DOWNLOADER_PATH = os.path.join(ROOT_DIR, "MissionDownloader", "MissionDownloader.py")
+CONFIG_PATH = os.path.join(ROOT_DIR, "ReviewHelper", "config.yaml")
+
+REPO_OWNER = "bench"
+REPO_NAME = "CO30_Benchmark_Mission.Altis"
+BRANCH = "master"
+
+
+def load_script(name, path):
+    # Imports script by file path (scripts are not packages and may have dots in names)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+
+
+class MissionGenerator:
+    """
+        Generates synthetic tSF mission and matching reference tree.
+        Mission paths are taken from ReviewHelper config, so every checklist entry exists.
+    """
+
+    def __init__(self, cfg, kits, gat_rows, modules, assets, asset_size, seed=1):
+        self.cfg = cfg
+        self.kits = kits
+        self.gat_rows = gat_rows
+        self.modules = modules
+        self.assets = assets
+        self.asset_size = asset_size
+        self.random = random.Random(seed)
+
+    def to_path(self, filename):
+        # Converts config path (Windows separators, _tSF_ shortcut) to '/' separated mission path
+        if filename.lower().startswith("_tsf_"):
+            filename = self.cfg["tSF_config"]["path"] + filename[len("_tSF_"):]
+        return filename.replace("\\", "/")
+
+    def get_module_names(self):
+        names = []
+        for fileInfo in self.cfg["Checklist"]["tSF_modules"]:
+            module = fileInfo["file"].replace("\\", "/").split("/")[1]
+            if module not in names:
+                names.append(module)
+        return names
+
+    def generate_reference(self):
+        # Returns: Dict of reference files paths to content (DICT)
+        files = {}
+        for checklist in self.cfg["Checklist"].values():
+            for fileInfo in checklist:
+                path = self.to_path(fileInfo["file"])
+                files[path] = "// tSF reference: {}\n".format(path).encode("utf-8")
+
+        files[self.to_path(self.cfg["tSF_config"]["config"])] = self.generate_tsf_init(0).encode("utf-8")
+        return files
+
+    def generate_mission(self):
+        # Returns: Dict of mission files paths to content (DICT)
+        files = self.generate_reference()
+        files["init.sqf"] = b"// Edited init\n[] execVM \"dzn_gear\\init.sqf\";\n"
+        files[self.to_path(self.cfg["tSF_config"]["config"])] = self.generate_tsf_init(self.modules).encode("utf-8")
+        files[self.to_path(self.cfg["dzn_Gear"]["kits_file"])] = self.generate_kits().encode("utf-8")
+        files[self.to_path(self.cfg["dzn_Gear"]["gat_file"])] = self.generate_gat().encode("utf-8")
+        files["dzn_dynai/Zones.sqf"] = self.generate_zones().encode("utf-8")
+
+        for module in self.get_module_names()[:self.modules]:
+            path = self.to_path("_tSF_\\{}\\Settings.sqf".format(module))
+            files[path] = "// {} settings\nGVAR(PilotKit) = \"{}\";\nCrewKitname = \"{}\";\n".format(
+                module, self.kit_name(0), self.kit_name(1)
+            ).encode("utf-8")
+
+        for i in range(self.assets):
+            files["sounds/asset_{}.ogg".format(i)] = self.random.randbytes(self.asset_size)
+
+        files["README.md"] = b"# Benchmark mission\n### Version: 1A\n"
+        files["init3DEN.sqf"] = b"// 3DEN init\n"
+        files["dzn_tSFramework/3DEN/tool.sqf"] = b"// 3DEN tool\n"
+        return files
+
+    def generate_tsf_init(self, enabled):
+        lines = ["// tSF modules"]
+        for i, module in enumerate(self.get_module_names()):
+            lines.append("tSF_module_{} = {};".format(module, "true" if i < enabled else "false"))
+        return "\n".join(lines) + "\n"
+
+    def kit_name(self, i):
+        return "kit_bench_{}".format(i % max(1, self.kits))
+
+    def generate_kits(self):
+        lines = []
+        for i in range(self.kits):
+            if i % 10 == 9:
+                lines.append("// kit_bench_old_{} = [];".format(i))
+            if i % 5 == 4:
+                lines.append("{} = [[\"{}\"]];".format(self.kit_name(i), self.kit_name(i - 1)))
+                continue
+            lines.extend([
+                "{} =".format(self.kit_name(i)),
+                "[",
+                "    \"#(default)\",",
+                "    [\"U_B_CombatUniform_mcam\", \"V_PlateCarrier1_rgr\", \"B_AssaultPack_mcamo\", \"H_HelmetB\"],",
+                "    [\"arifle_MX_F\", \"30Rnd_65x39_caseless_mag\", 6],",
+                "    [[\"FirstAidKit\", 2], [\"SmokeShell\", 2]] /* medical */",
+                "];"
+            ])
+        return "\n".join(lines) + "\n"
+
+    def generate_gat(self):
+        lines = ["dzn_gear_GATable = ["]
+        for i in range(self.gat_rows):
+            lines.append("    \"Unit {}\" TO \"{}\" KIT,".format(i, self.kit_name(self.random.randrange(self.kits * 2))))
+        lines.append("    \"Random\" TO \"@random\" KIT")
+        lines.append("];")
+        return "\n".join(lines) + "\n"
+
+    def generate_zones(self):
+        lines = []
+        for i in range(max(1, self.gat_rows // 4)):
+            lines.append("    [\"Zone {}\", \"{}\", [0, 0, 0]],".format(i, self.kit_name(self.random.randrange(self.kits * 2))))
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def write_tree(files, root):
+        for path, content in files.items():
+            full_path = os.path.join(root, *path.split("/"))
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "wb") as f:
+                f.write(content)
+
+    @staticmethod
+    def write_archive(files, filename, top_dir):
+        with ZipFile(filename, "w", ZIP_DEFLATED) as archive:
+            for path, content in files.items():
+                archive.writestr("{}/{}".format(top_dir, path), content)
+
+
+
+
+class ArchiveServer:
+    """
+        Local HTTP stand-in for GitHub: serves files from directory, supports Range requests, HEAD and ETag
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.requests = []
+        self.etags = {}
+        handler = self.create_handler()
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server.server_port)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_etag(self, path):
+        # Returns: Quoted SHA1 of file content, computed once per file version (STRING)
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        if key not in self.etags:
+            with open(path, "rb") as f:
+                self.etags[key] = '"{}"'.format(hashlib.sha1(f.read()).hexdigest())
+        return self.etags[key]
+
+    def create_handler(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_HEAD(self):
+                self.serve(False)
+
+            def do_GET(self):
+                self.serve(True)
+
+            def serve(self, with_body):
+                server.requests.append((self.command, self.path))
+                path = os.path.join(server.root, *self.path.split("?")[0].strip("/").split("/"))
+                if not os.path.isfile(path):
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                etag = server.get_etag(path)
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+
+                size = os.path.getsize(path)
+                start = 0
+                r = re.match(r"bytes=(\d+)-$", self.headers.get("Range", ""))
+                if r:
+                    start = int(r[1])
+                    if start >= size:
+                        self.send_response(416)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", "bytes {}-{}/{}".format(start, size - 1, size))
+                else:
+                    self.send_response(200)
+
+                self.send_header("Content-Type", "application/zip")
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(size - start))
+                self.end_headers()
+                if not with_body:
+                    return
+
+                with open(path, "rb") as f:
+                    f.seek(start)
+                    shutil.copyfileobj(f, self.wfile)
+
+        return Handler
+
+
+
+
+class Benchmark:
+    """
+        Times ReviewHelper and MissionDownloader stages over generated mission
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.stages = {}
+        self.work_dir = None
+        self.rh = None
+        self.md = None
+
+    def measure(self, name, action, prepare=None):
+        # Runs action <repeat> times, calling prepare (not timed) before each run
+        # Returns: Result of the last run
+        runs = []
+        result = None
+        error = ""
+        for _ in range(self.args.repeat):
+            if prepare:
+                prepare()
+            started = time.perf_counter()
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = action()
+            except (Exception, SystemExit) as e:
+                error = "{}: {}".format(type(e).__name__, e)
+                break
+            runs.append(time.perf_counter() - started)
+
+        self.stages[name] = {
+            "runs": runs,
+            "min": min(runs) if runs else None,
+            "median": statistics.median(runs) if runs else None,
+            "mean": statistics.mean(runs) if runs else None,
+            "error": error
+        }
+        print("  {:<40} {}".format(name, self.format_stage(self.stages[name])))
+        return result
+
+    @staticmethod
+    def format_stage(stage):
+        if stage["error"] and not stage["runs"]:
+            return "FAILED ({})".format(stage["error"])
+        return "median {:.4f} s, min {:.4f} s".format(stage["median"], stage["min"])
+
+    def run(self):
+        self.work_dir = tempfile.mkdtemp(prefix="tSF_Benchmark_")
+        cwd = os.getcwd()
+        try:
+            self.setup()
+            os.chdir(self.work_dir)
+            self.run_stages()
+        finally:
+            os.chdir(cwd)
+            if self.args.keep:
+                print("Benchmark files kept in " + self.work_dir)
+            else:
+                shutil.rmtree(self.work_dir, ignore_errors=True)
+
+        return self.stages
+
+    def setup(self):
+        import yaml
+        with open(CONFIG_PATH, "r") as f:
+            cfg = yaml.load(f, Loader=yaml.BaseLoader)
+
+        args = self.args
+        generator = MissionGenerator(cfg, args.kits, args.gat_rows, args.modules, args.assets, args.asset_size, args.seed)
+        mission = generator.generate_mission()
+
+        # Reference tree and review config
+        MissionGenerator.write_tree(generator.generate_reference(), os.path.join(self.work_dir, "tSFReference"))
+        with open(CONFIG_PATH, "r") as f:
+            config = f.read()
+        with open(os.path.join(self.work_dir, "config.yaml"), "w") as f:
+            # Archive cache is kept in work directory, so benchmark never touches user's cache
+            f.write(re.sub(r"^archive_cache:.*$", "archive_cache: ArchiveCache", config, flags=re.M))
+
+        # Mission as local directory and as served GitHub archive
+        MissionGenerator.write_tree(mission, os.path.join(self.work_dir, "mission", REPO_NAME))
+        archive_dir = os.path.join(self.work_dir, "www", REPO_OWNER, REPO_NAME, "archive")
+        os.makedirs(archive_dir)
+        self.archive = os.path.join(archive_dir, BRANCH + ".zip")
+        MissionGenerator.write_archive(mission, self.archive, "{}-{}".format(REPO_NAME, BRANCH))
+
+        self.params = {
+            "kits": args.kits, "gat_rows": args.gat_rows, "modules": args.modules,
+            "assets": args.assets, "asset_size": args.asset_size, "repeat": args.repeat,
+            "files": len(mission), "archive_size": os.path.getsize(self.archive)
+        }
+        print("Generated mission: {} files, archive {:.1f} MB".format(len(mission), self.params["archive_size"] / 1048576))
+
+        self.rh = load_script("tSF_ReviewHelper", REVIEW_HELPER_PATH)
+        self.md = load_script("MissionDownloader", MISSION_DOWNLOADER_PATH)
+
+    def run_stages(self):
+        server = ArchiveServer(os.path.join(self.work_dir, "www")).start()
+        repo_url = "{}/{}/{}".format(server.url, REPO_OWNER, REPO_NAME)
+        try:
+            self.run_download_stages(repo_url)
+            self.run_settings_stages()
+            self.run_diff_stage()
+            self.run_review_stages(repo_url, "url")
+            self.run_review_stages(os.path.join(self.work_dir, "mission", REPO_NAME), "local")
+            self.run_downloader_stages()
+        finally:
+            server.stop()
+
+    def run_download_stages(self, repo_url):
+        reporter = self.rh.Reporter("", quiet=True)
+        downloader = self.rh.Downloader(reporter)
+        archive_name = downloader.get_archive_name(self.rh.Downloader.URL_FORMAT.format(repo_url, BRANCH))
+
+        def clear():
+            for name in (archive_name, archive_name + downloader.PARTIAL_SUFFIX):
+                if os.path.isfile(name):
+                    os.remove(name)
+            shutil.rmtree(REPO_NAME, ignore_errors=True)
+
+        self.measure("Downloader.download_archive", lambda: downloader.download_archive(repo_url), clear)
+
+        cache = self.rh.ArchiveCache("DownloadCache", 1024 ** 3)
+        cached_downloader = self.rh.Downloader(reporter, cache=cache)
+        cached_downloader.download_archive(repo_url)
+        self.measure(
+            "Downloader.download_archive (cached)", lambda: cached_downloader.download_archive(repo_url), clear
+        )
+        self.measure(
+            "Downloader.unzip",
+            lambda: downloader.unzip(archive_name),
+            lambda: (clear(), shutil.copyfile(self.archive, archive_name))
+        )
+        clear()
+        reporter.close()
+
+    def run_settings_stages(self):
+        self.measure("ConfigReader (parse)", lambda: self.rh.ConfigReader("config.yaml", use_cache=False))
+        self.measure("ConfigReader (cached)", lambda: self.rh.ConfigReader("config.yaml"))
+        cfg = self.rh.ConfigReader("config.yaml")
+        for kind, files in (
+            ("local", self.rh.MissionFiles(os.path.join(self.work_dir, "mission", REPO_NAME))),
+            ("url", self.rh.ZipMissionFiles(self.archive))
+        ):
+            self.measure("tSFSettings ({})".format(kind), lambda: self.rh.tSFSettings(cfg, files))
+            self.measure("GearSettings ({})".format(kind), lambda: self.rh.GearSettings(cfg, files))
+            files.close()
+
+    def run_diff_stage(self):
+        # Diffs Kits.sqf against its copy with every 25th line edited
+        cfg = self.rh.ConfigReader("config.yaml")
+        files = self.rh.MissionFiles(os.path.join(self.work_dir, "mission", REPO_NAME))
+        kits = files.get_path(cfg.get(("dzn_Gear", "kits_file")))
+        lines = files.read_text(kits).splitlines()
+        edited_dir = os.path.join(self.work_dir, "edited")
+        os.makedirs(edited_dir)
+        with open(os.path.join(edited_dir, "Kits.sqf"), "w") as f:
+            f.write("\n".join(line + " // edited" if i % 25 == 0 else line for i, line in enumerate(lines)) + "\n")
+
+        comparator = self.rh.Comparator()
+        edited = self.rh.MissionFiles(edited_dir)
+
+        def clear():
+            # Measure reading of both files too
+            files.cache = self.rh.FileCache()
+            edited.cache = self.rh.FileCache()
+
+        self.measure(
+            "Comparator.diff (Kits.sqf)",
+            lambda: comparator.diff(files, kits, edited, edited.get_path("Kits.sqf"), "Kits.sqf"),
+            clear
+        )
+
+    def run_review_stages(self, mission, kind):
+        reviewers = []
+
+        def create():
+            reviewer = self.rh.Reviewer(mission, os.path.join("review_" + kind), quiet=True)
+            reviewers.append(reviewer)
+
+        def prepare():
+            reviewer = reviewers[-1]
+            reviewer.prepare()
+            # Measure full work on every run, not results reused from previous run
+            reviewer.cache = None
+
+        name = "Reviewer.prepare ({})".format(kind)
+        self.measure(name, prepare, create)
+        reviewer = reviewers[-1]
+
+        if not self.stages[name]["error"]:
+            for list_name in self.rh.Reviewer.REVIEW_LISTS:
+                self.measure("Reviewer.review {} ({})".format(list_name, kind), lambda: reviewer.review(list_name))
+            self.measure("Reviewer.review_gear ({})".format(kind), reviewer.review_gear)
+            self.measure("Reviewer.review_kits ({})".format(kind), reviewer.review_kits)
+
+            def forget_hashes():
+                reviewer.file_hashes.clear()
+                reviewer.known_hashes = {}
+                reviewer.target_files.cache = self.rh.FileCache()
+
+            self.measure("Reviewer.review_tree ({})".format(kind), reviewer.review_tree, forget_hashes)
+
+        for reviewer in reviewers:
+            reviewer.close()
+
+    def run_downloader_stages(self):
+        with ZipFile(self.archive, "r") as archive:
+            top_dir = "{}-{}".format(REPO_NAME, BRANCH)
+
+            def extract():
+                shutil.rmtree(top_dir, ignore_errors=True)
+                archive.extractall()
+
+            self.measure("MissionDownloader.CleanMissionFiles", lambda: self.md.CleanMissionFiles(top_dir), extract)
+            self.measure(
+                "MissionDownloader.UnzipCleanedMission",
+                lambda: self.md.UnzipCleanedMission(archive, top_dir + "/"),
+                lambda: shutil.rmtree(top_dir, ignore_errors=True)
+            )
+            self.measure(
+                "MissionDownloader.WritePbo",
+                lambda: self.md.WritePbo(top_dir + ".pbo", self.md.CollectMissionFiles(top_dir))
+            )
+            shutil.rmtree(top_dir, ignore_errors=True)
+
+
+def get_version():
+    # Returns: Git revision of benchmarked code or empty string (STRING)
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT_DIR, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(results, baseline_file):
+    # Prints median times against previously saved results
+    with open(baseline_file, "r") as f:
+        baseline = json.load(f)
+
+    print("\nComparison with {} ({})".format(baseline_file, baseline.get("version", "unknown")))
+    row = "{:<40} {:>10} {:>10} {:>8}"
+    print(row.format("Stage", "Before, s", "After, s", "Ratio"))
+    for name, stage in results["stages"].items():
+        before = baseline.get("stages", {}).get(name, {}).get("median")
+        after = stage["median"]
+        if before is None or after is None:
+            print(row.format(name, "-" if before is None else "{:.4f}".format(before), "-" if after is None else "{:.4f}".format(after), "-"))
+            continue
+        print(row.format(name, "{:.4f}".format(before), "{:.4f}".format(after), "{:.2f}x".format(before / after if after else 0)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="tSF tools benchmark")
+    parser.add_argument("--kits", type=int, default=200, help="Number of kits in Kits.sqf")
+    parser.add_argument("--gat-rows", type=int, default=100, help="Number of GAT rows")
+    parser.add_argument("--modules", type=int, default=10, help="Number of enabled tSF modules")
+    parser.add_argument("--assets", type=int, default=10, help="Number of extra binary assets")
+    parser.add_argument("--asset-size", type=int, default=512 * 1024, help="Size of every extra asset, bytes")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of every stage")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed of generated mission")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="Results JSON file")
+    parser.add_argument("-c", "--compare", help="Previous results JSON file to compare with")
+    parser.add_argument("--keep", action="store_true", help="Keep generated files")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    args.repeat = max(1, args.repeat)
+
+    benchmark = Benchmark(args)
+    stages = benchmark.run()
+    results = {
+        "version": get_version(),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": benchmark.params,
+        "stages": stages
+    }
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("Results saved to " + args.output)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,3 @@
-url = input("GitHub repo URL:")
-mode = int(input("Select mode: [1] - Download, [2] - Download & pack\n"))
 steps = "6"
 
 import requests
@@ -7,45 +5,268 @@ import re
 import os
 import shutil
 import sys
+import hashlib
+import json
+import struct
+import time
 
-def DownalodAndUnzipFiles(url):
-    print("[1/" + steps + "] Getting Readme.md...")
+CHUNK_SIZE = 64 * 1024
+PROGRESS_STEP = 1024 * 1024
 
-    urlReadme = "https://raw.githubusercontent.com/" + url.rsplit('/',2)[1] + "/" + url.rsplit('/',2)[2] + "/master/README.md"
+### Archive cache, shared with ReviewHelper (same layout): <sha1 of URL>.zip + <sha1 of URL>.json (URL, ETag, commit SHA)
+# Cached archive is revalidated with If-None-Match, least recently used archives are evicted by total size
+ARCHIVE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".tSF_ArchiveCache")
+ARCHIVE_CACHE_SIZE = 512 * 1024 * 1024
 
-    readmeRequest = requests.get(urlReadme, allow_redirects=True)
-    readmeText = readmeRequest.text
+### Mission cleanup: files and directories not needed in packed mission, plus directories of disabled tSF modules
+CLEANUP_FILES = [
+    "init3DEN.sqf",
+    "README.md",
+    "tSF_FileSweeper.bat",
+    "tSF_FS_log.txt",
+    ".gitattributes",
+    "dzn_tSFramework\\tS_SettingsOverview.html"
+]
+CLEANUP_DIRS = [
+    "dzn_tSFramework\\3DEN\\",
+    "dzn_tSFramework\\Modules\\Briefing\\BriefingHelper\\",
+    "dzn_tSFramework\\Modules\\MissionConditions\\EndingsHelper\\",
+    "dzn_dynai\\tools\\"
+]
+TSF_INIT = "dzn_tSFramework\\dzn_tSFramework_Init.sqf"
+TSF_MODULES_DIR = "dzn_tSFramework\\Modules\\"
+TSF_MODULE_RXP = re.compile(r'(tSF_module_)([a-zA-Z\_]*)([\s=]+)(false|true)', re.I)
 
-    version = "1A"    
-    versionRXP = re.compile('(Version: (\d[A-Za-z]))')
-    versionSearched = versionRXP.search(readmeText)
-    if versionSearched:
-        version = versionSearched[2]
+def DownloadFile(url, filename, useCache=True):
+    # Streams file to disk by chunks, resuming partially downloaded <filename>.part with HTTP range request.
+    # Range is requested with If-Range of ETag saved next to .part file (<filename>.part.etag), so file changed
+    # since download was started is downloaded from scratch instead of being appended to old bytes.
+    # File cached by previous downloads is requested conditionally and restored from cache if not modified.
+    partFilename = filename + ".part"
+    offset = os.path.getsize(partFilename) if os.path.exists(partFilename) else 0
+    partETag = ReadPartialETag(partFilename) if offset else ""
+    if offset and not partETag:
+        RemovePartialFile(partFilename)
+        offset = 0
+    headers = {"Range": "bytes=" + str(offset) + "-", "If-Range": partETag} if offset else {}
+    cached = ReadCacheEntry(url) if useCache and not offset else None
+    if cached:
+        headers["If-None-Match"] = cached["etag"]
 
-    print("Version: " + version)
+    try:
+        with requests.get(url, headers=headers, stream=True, allow_redirects=True) as response:
+            if cached and response.status_code == 304:
+                response.close()
+                if RestoreCachedArchive(url, filename):
+                    print("    Archive is not changed, using cached copy")
+                    return True
+                return DownloadFile(url, filename, False)
+
+            if offset and response.status_code == 416:
+                print("    Failed to resume download, restarting...")
+                response.close()
+                RemovePartialFile(partFilename)
+                return DownloadFile(url, filename)
+
+            if response.status_code not in (200, 206):
+                print("    Unexpected response " + str(response.status_code) + " for " + url)
+                return False
+
+            etag = response.headers.get("ETag")
+            if response.status_code == 200:
+                # Server ignores range requests or file was changed - download from scratch
+                offset = 0
+                SavePartialETag(partFilename, etag)
+            else:
+                print("    Resuming download from " + str(offset) + " bytes")
+
+            total = int(response.headers.get("Content-Length", 0))
+            if total:
+                total += offset
+
+            done = offset
+            nextReport = done + PROGRESS_STEP
+            with open(partFilename, "ab" if offset else "wb") as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+                    done += len(chunk)
+                    if done >= nextReport:
+                        PrintProgress(done, total)
+                        nextReport = done + PROGRESS_STEP
+    except (requests.RequestException, OSError) as e:
+        print("    Download interrupted: " + str(e))
+        return False
+
+    if total and done < total:
+        print("    Download incomplete: " + str(done) + " of " + str(total) + " bytes")
+        return False
+
+    PrintProgress(done, total)
+    os.replace(partFilename, filename)
+    RemovePartialFile(partFilename)
+    if useCache:
+        StoreCachedArchive(url, filename, etag)
+    return True
+
+
+def ReadPartialETag(partFilename):
+    # Returns ETag of file partial download belongs to or empty string
+    try:
+        with open(partFilename + ".etag", "r") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def SavePartialETag(partFilename, etag):
+    # Weak ETags can't be used in If-Range, partial download of such file is not resumed
+    if etag and not etag.startswith("W/"):
+        with open(partFilename + ".etag", "w") as f:
+            f.write(etag)
+    elif os.path.exists(partFilename + ".etag"):
+        os.remove(partFilename + ".etag")
 
-    print("[2/" + steps + "] Getting mission archive...")
+
+def RemovePartialFile(partFilename):
+    for name in (partFilename, partFilename + ".etag"):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+def GetCacheEntryName(url):
+    return os.path.join(ARCHIVE_CACHE_DIR, hashlib.sha1(url.encode()).hexdigest())
+
+
+def ReadCacheEntry(url):
+    # Returns metadata of cached archive or None
+    entryName = GetCacheEntryName(url)
+    try:
+        with open(entryName + ".json", "r") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    
+    if meta.get("url") != url or not meta.get("etag") or not os.path.isfile(entryName + ".zip"):
+        return None
+    return meta
+
+
+def LinkOrCopy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def RestoreCachedArchive(url, filename):
+    # Places cached archive to filename and marks it as recently used
+    archive = GetCacheEntryName(url) + ".zip"
+    try:
+        os.utime(archive)
+        if os.path.exists(filename):
+            os.remove(filename)
+        LinkOrCopy(archive, filename)
+    except OSError:
+        return False
+    return True
+
+
+def StoreCachedArchive(url, filename, etag):
+    # Archive is replaced before metadata, so interrupted update only costs a download
+    if not etag:
+        return
+    
+    from zipfile import ZipFile, BadZipFile
+    try:
+        with ZipFile(filename, "r") as zipObj:
+            comment = zipObj.comment.decode("ascii", "ignore").strip()
+    except (OSError, BadZipFile):
+        return
+    
+    entryName = GetCacheEntryName(url)
+    tmpName = entryName + "." + str(os.getpid()) + ".tmp"
+    meta = {
+        "url": url, "etag": etag, "commit": comment if re.fullmatch(r"[0-9a-f]{40}", comment) else "",
+        "size": os.path.getsize(filename), "stored": time.time()
+    }
+    try:
+        os.makedirs(ARCHIVE_CACHE_DIR, exist_ok=True)
+        LinkOrCopy(filename, tmpName)
+        os.replace(tmpName, entryName + ".zip")
+        with open(tmpName, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmpName, entryName + ".json")
+    except OSError:
+        return
+    EvictCachedArchives()
+
+
+def EvictCachedArchives():
+    # Removes least recently used archives until cache fits ARCHIVE_CACHE_SIZE
+    archives = []
+    with os.scandir(ARCHIVE_CACHE_DIR) as entries:
+        for entry in entries:
+            if entry.name.endswith(".zip") and entry.is_file():
+                stat = entry.stat()
+                archives.append((stat.st_mtime, stat.st_size, entry.path))
+    
+    total = sum(size for mtime, size, path in archives)
+    for mtime, size, path in sorted(archives):
+        if total <= ARCHIVE_CACHE_SIZE:
+            break
+        for name in (path, path[:-len(".zip")] + ".json"):
+            if os.path.exists(name):
+                os.remove(name)
+        total -= size
+
+
+def PrintProgress(done, total):
+    if total:
+        print("    Downloaded {:.1f} of {:.1f} MB ({}%)".format(done / 1048576, total / 1048576, done * 100 // total))
+    else:
+        print("    Downloaded {:.1f} MB".format(done / 1048576))
+
+
+def DownalodAndUnzipFiles(url, clean=False):
+    print("[1/" + steps + "] Getting mission archive...")
 
     urlZip = url + "/archive/master.zip"
 
     filename = url.rsplit('/',1)[1] + "-master"
     zipFilename = filename + "-master.zip"
-    zipRequest = requests.get(urlZip, allow_redirects=True)
     
     if os.path.exists(zipFilename):
         os.remove(zipFilename)
     
-    open(zipFilename, "wb").write(zipRequest.content)
+    if not DownloadFile(urlZip, zipFilename):
+        sys.exit("Failed to download mission archive")
 
     print("Mission archive downloaded - " + zipFilename)
 
-    print("[3/" + steps + "] Unzipping archive...")
+    print("[2/" + steps + "] Reading Readme.md...")
 
     from zipfile import ZipFile
     with ZipFile(zipFilename,'r') as zipObj:
-        zipObj.extractall()
-        
-    os.remove(zipFilename)
+        # README.md of the archive is the one of master branch, no need to request it separately
+        readmeName = filename + "/README.md"
+        readmeText = zipObj.read(readmeName).decode("utf-8", "ignore") if readmeName in zipObj.NameToInfo else ""
+
+    version = "1A"    
+    versionRXP = re.compile('(Version: (\d[A-Za-z]))')
+    versionSearched = versionRXP.search(readmeText)
+    if versionSearched:
+        version = versionSearched[2]
+
+    print("Version: " + version)
+
+    print("[3/" + steps + "] Unzipping archive...")
+
+    IsExcluded = None
+    with ZipFile(zipFilename,'r') as zipObj:
+        if clean:
+            IsExcluded = UnzipCleanedMission(zipObj, filename + "/")
+        else:
+            zipObj.extractall()
 
     print("Unzipped to " + filename)
 
@@ -69,71 +290,347 @@ def DownalodAndUnzipFiles(url):
     os.rename(filename, filenameRenamed)
     print("Renamed to " + filenameRenamed)
     
+    if clean:
+        PackMission(filenameRenamed, zipFilename, filename + "/", IsExcluded)
+    
+    os.remove(zipFilename)
+    
     return filenameRenamed
 
 
-def PackMission(filename):
+def PackMission(filename, zipFilename="", prefix="", IsExcluded=None):
+    # Packs mission to <filename>.pbo. Members of downloaded archive, which survived cleanup at unzipping,
+    # are streamed straight from the archive; otherwise mission directory is cleaned and packed from disk.
+    if zipFilename:
+        print("[5/" + steps + "] Mission files were cleaned during unzipping")
+        print("[6/" + steps + "] Packing from archive...")
+        from zipfile import ZipFile
+        with ZipFile(zipFilename, "r") as zipObj:
+            WriteAndVerifyPbo(filename + ".pbo", CollectZipMembers(zipObj, prefix, IsExcluded))
+        return
     
     CleanMissionFiles(filename)
-    
     print("[6/" + steps + "] Packing...")
-    import subprocess
-    subprocess.run(["MakePbo","-N", os.path.abspath(filename)])
-    print("Packed!")
+    WriteAndVerifyPbo(filename + ".pbo", CollectMissionFiles(filename))
+
+
+def WriteAndVerifyPbo(pboFilename, entries):
+    WritePbo(pboFilename, entries)
+    
+    if not VerifyPbo(pboFilename, entries):
+        sys.exit("Packed PBO is malformed: " + pboFilename)
+    print("Packed to " + pboFilename + " (" + str(len(entries)) + " files)")
+
+
+### PBO packing
+# PBO layout: header entries (file table), data of files in table order, 0x00 + SHA1 of everything before it.
+# Header entry: ASCIIZ name + 5 x uint32 (packing method, original size, reserved, timestamp, data size),
+# files are stored uncompressed (method and original size are 0).
+# First entry is "Vers" entry with no name, followed by ASCIIZ key/value header extensions ended by empty string,
+# file table is ended by entry with no name and zeroes.
+PBO_VERS = 0x56657273
+PBO_ENTRY = struct.Struct("<5I")
+
+
+class PboEntry:
+    # File to be packed: name inside PBO (backslash separated), size, timestamp and function opening its data
+    def __init__(self, name, size, timestamp, opener):
+        self.name = name
+        self.size = size
+        self.timestamp = timestamp
+        self.open = opener
+
+
+class HashingWriter:
+    # Writes to file and updates SHA1 of all written data
+    def __init__(self, f):
+        self.f = f
+        self.sha1 = hashlib.sha1()
+
+    def write(self, data):
+        self.sha1.update(data)
+        self.f.write(data)
+
+
+def CollectMissionFiles(dirname):
+    # Returns list of PboEntry for all files of mission directory
+    entries = []
+    for root, dirs, names in os.walk(dirname):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            pboName = os.path.relpath(path, dirname).replace(os.sep, "\\")
+            entries.append(PboEntry(pboName, stat.st_size, int(stat.st_mtime), lambda path=path: open(path, "rb")))
+    
+    return entries
+
+
+def CollectZipMembers(zipObj, prefix="", excluded=None):
+    # Returns list of PboEntry for zip members under prefix dir, skipping excluded members (names relative to prefix)
+    entries = []
+    for info in zipObj.infolist():
+        if info.is_dir() or not info.filename.startswith(prefix):
+            continue
+        name = info.filename[len(prefix):]
+        if excluded and excluded(name):
+            continue
+        timestamp = int(time.mktime(info.date_time + (0, 0, -1)))
+        entries.append(PboEntry(name.replace("/", "\\"), info.file_size, timestamp, lambda info=info: zipObj.open(info)))
+    
+    return entries
+
+
+def WritePbo(pboFilename, entries, headerExtensions=None):
+    # Streams entries to PBO file chunk by chunk, so memory use doesn't depend on mission size
+    with open(pboFilename, "wb") as f:
+        out = HashingWriter(f)
+        
+        out.write(b"\0" + PBO_ENTRY.pack(PBO_VERS, 0, 0, 0, 0))
+        for key, value in (headerExtensions or {}).items():
+            out.write(key.encode("utf-8") + b"\0" + value.encode("utf-8") + b"\0")
+        out.write(b"\0")
+        
+        for entry in entries:
+            out.write(entry.name.encode("utf-8") + b"\0" + PBO_ENTRY.pack(0, 0, 0, entry.timestamp, entry.size))
+        out.write(b"\0" + PBO_ENTRY.pack(0, 0, 0, 0, 0))
+        
+        for entry in entries:
+            written = 0
+            with entry.open() as data:
+                for chunk in iter(lambda: data.read(CHUNK_SIZE), b""):
+                    out.write(chunk)
+                    written += len(chunk)
+            if written != entry.size:
+                raise ValueError("Size of " + entry.name + " has changed during packing")
+        
+        f.write(b"\0" + out.sha1.digest())
+
+
+def ReadAsciiz(f):
+    chars = bytearray()
+    while True:
+        c = f.read(1)
+        if not c:
+            raise ValueError("Unexpected end of PBO header")
+        if c == b"\0":
+            return chars.decode("utf-8")
+        chars += c
+
+
+def ReadPbo(pboFilename):
+    # Reference PBO reader: parses file table and validates SHA1 trailer
+    # Returns (header extensions dict, list of (name, size, timestamp, data offset)); raises ValueError if malformed
+    with open(pboFilename, "rb") as f:
+        extensions = {}
+        entries = []
+        
+        while True:
+            name = ReadAsciiz(f)
+            method, originalSize, reserved, timestamp, dataSize = PBO_ENTRY.unpack(f.read(PBO_ENTRY.size))
+            
+            if not name and method == PBO_VERS:
+                key = ReadAsciiz(f)
+                while key:
+                    extensions[key] = ReadAsciiz(f)
+                    key = ReadAsciiz(f)
+                continue
+            if not name:
+                break
+            if method != 0:
+                raise ValueError("Compressed entries are not supported: " + name)
+            entries.append([name, dataSize, timestamp])
+        
+        offset = f.tell()
+        for entry in entries:
+            entry.append(offset)
+            offset += entry[1]
+        
+        f.seek(0)
+        sha1 = hashlib.sha1()
+        left = offset
+        while left:
+            chunk = f.read(min(CHUNK_SIZE, left))
+            if not chunk:
+                raise ValueError("PBO data is truncated")
+            sha1.update(chunk)
+            left -= len(chunk)
+        
+        if f.read(21) != b"\0" + sha1.digest():
+            raise ValueError("PBO checksum mismatch")
+    
+    return extensions, [tuple(entry) for entry in entries]
+
+
+def ReadPboData(f, offset, size):
+    # Reference unpacker: yields data of PBO entry stored at offset, chunk by chunk
+    f.seek(offset)
+    left = size
+    while left:
+        chunk = f.read(min(CHUNK_SIZE, left))
+        if not chunk:
+            raise ValueError("PBO data is truncated")
+        yield chunk
+        left -= len(chunk)
+
+
+def HashChunks(chunks):
+    sha1 = hashlib.sha1()
+    for chunk in chunks:
+        sha1.update(chunk)
+    return sha1.digest()
+
+
+def VerifyPbo(pboFilename, entries):
+    # Round-trip check: PBO is readable, checksum is valid, file table matches packed entries and data of every
+    # entry, read back at its offset, has the same hash as its source file
+    try:
+        extensions, packed = ReadPbo(pboFilename)
+    except (ValueError, struct.error) as e:
+        print("    PBO verification failed: " + str(e))
+        return False
+    
+    expected = [(entry.name, entry.size, entry.timestamp) for entry in entries]
+    actual = [(name, size, timestamp) for name, size, timestamp, offset in packed]
+    if expected != actual:
+        print("    PBO verification failed: file table doesn't match packed files")
+        return False
+    
+    with open(pboFilename, "rb") as f:
+        for entry, (name, size, timestamp, offset) in zip(entries, packed):
+            with entry.open() as data:
+                source = HashChunks(iter(lambda: data.read(CHUNK_SIZE), b""))
+            try:
+                unpacked = HashChunks(ReadPboData(f, offset, size))
+            except ValueError as e:
+                print("    PBO verification failed: " + str(e))
+                return False
+            if source != unpacked:
+                print("    PBO verification failed: data of " + name + " doesn't match packed file")
+                return False
+    
+    return True
+
+
+def ReadModulesState(lines):
+    # Returns dict of tSF module name -> enabled, parsed from dzn_tSFramework_Init.sqf lines
+    modules = {}
+    for line in lines:
+        r = TSF_MODULE_RXP.search(line)
+        if r:
+            modules[r[2]] = r[4].lower() == 'true'
+    
+    return modules
+
+
+def NormalizePath(path):
+    # Returns '/' separated lowercase relative path, regardless of OS and separators used in constants
+    return path.replace("\\", "/").replace(os.sep, "/").strip("/").lower()
+
+
+def IndexMissionPaths(dirname):
+    # Walks mission directory once
+    # Returns dict of normalized relative path -> path for every file and directory of the mission
+    paths = {}
+    for root, dirs, files in os.walk(dirname):
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            paths.setdefault(NormalizePath(os.path.relpath(path, dirname)), path)
+    
+    return paths
+
+
+def PlanMissionCleanup(zipObj, prefix):
+    # Reads tSF init from the archive and builds exclusion set of cleanup files/dirs and disabled modules dirs
+    # Returns function telling if member name (relative to prefix, '/' separated) should be skipped
+    files = {NormalizePath(f) for f in CLEANUP_FILES}
+    dirs = [NormalizePath(d) + "/" for d in CLEANUP_DIRS]
+    
+    names = {name.lower(): name for name in zipObj.NameToInfo}
+    initName = names.get((prefix + NormalizePath(TSF_INIT)).lower())
+    if initName:
+        from io import TextIOWrapper
+        with TextIOWrapper(zipObj.open(initName)) as tSFFile:
+            modules = ReadModulesState(tSFFile)
+        
+        modulesDir = NormalizePath(TSF_MODULES_DIR) + "/"
+        for moduleDir, moduleEnabled in modules.items():
+            if not moduleEnabled:
+                print("    Module " + moduleDir + " is disabled: skipping " + TSF_MODULES_DIR + moduleDir)
+                dirs.append(modulesDir + moduleDir.lower() + "/")
+    else:
+        print("    " + TSF_INIT + " not found, tSF modules are kept")
+    
+    dirs = tuple(dirs)
+    def IsExcluded(name):
+        name = name.lower()
+        return name in files or name.startswith(dirs)
+    
+    return IsExcluded
+
+
+def UnzipCleanedMission(zipObj, prefix):
+    # Extracts only members which survive mission cleanup, instead of extracting everything and deleting afterwards
+    # Returns cleanup filter, so the same members are packed from the archive
+    IsExcluded = PlanMissionCleanup(zipObj, prefix)
+    
+    skipped = 0
+    for info in zipObj.infolist():
+        name = info.filename[len(prefix):] if info.filename.startswith(prefix) else info.filename
+        if IsExcluded(name):
+            skipped += 1
+            continue
+        zipObj.extract(info)
+    
+    print("    Skipped " + str(skipped) + " files not needed in mission")
+    return IsExcluded
 
 
 def CleanMissionFiles(filename):
     print("[5/" + steps + "] Cleaning mission files from " + filename + "...")
     
+    ### Index mission once, so Windows-style paths of constants are found on any OS and in any letter case
+    paths = IndexMissionPaths(filename)
+    
     ### Remove files 
-    files = [
-        os.path.join(filename, "init3DEN.sqf"),
-        os.path.join(filename, "README.md"),
-        os.path.join(filename, "tSF_FileSweeper.bat"),
-        os.path.join(filename, "tSF_FS_log.txt"),
-        os.path.join(filename, ".gitattributes"),
-        os.path.join(filename, "dzn_tSFramework\\tS_SettingsOverview.html")
-    ]
-    dirs = [
-        os.path.join(filename, "dzn_tSFramework\\3DEN\\"),
-        os.path.join(filename, "dzn_tSFramework\\Modules\\Briefing\\BriefingHelper\\"),
-        os.path.join(filename, "dzn_tSFramework\\Modules\\MissionConditions\\EndingsHelper\\"),
-        os.path.join(filename, "dzn_dynai\\tools\\")
-    ]
-    
-    for f in files:
-        if os.path.exists(f):
-            print("    Deleting " + f)
-            os.remove(f)
-    
-    for d in dirs:
-        if os.path.exists(d):
-            print("    Deleting directory " + d)
-            shutil.rmtree(d)
+    for f in CLEANUP_FILES:
+        path = paths.get(NormalizePath(f))
+        if path and os.path.isfile(path):
+            print("    Deleting " + path)
+            os.remove(path)
+    
+    for d in CLEANUP_DIRS:
+        path = paths.get(NormalizePath(d))
+        if path and os.path.isdir(path):
+            print("    Deleting directory " + path)
+            shutil.rmtree(path)
     
     print("\nRemoving unused tSF Modules...")
-   
-    tSDir = os.path.join(filename, "dzn_tSFramework\\Modules\\")
-    tSFFile = open(os.path.join(filename, "dzn_tSFramework\\dzn_tSFramework_Init.sqf"), "r")
-    for line in tSFFile:
-        r = re.search(r'(tSF_module_)([a-zA-Z\_]*)([\s=]+)(false|true)', line, re.I)
-        if r:
-            moduleDir = r[2]
-            moduleEnabled = r[4].lower() == 'true'
-            modulePath = os.path.join(tSDir, moduleDir)
-            
-            if not moduleEnabled and os.path.exists(modulePath):
-                print("    Module " + moduleDir + " is disabled: removing " + os.path.join(tSDir, moduleDir))
-                shutil.rmtree(modulePath)
     
-    tSFFile.close()
+    initPath = paths.get(NormalizePath(TSF_INIT))
+    if not initPath:
+        print("    " + TSF_INIT + " not found, tSF modules are kept")
+        return
+    
+    with open(initPath, "r") as tSFFile:
+        modules = ReadModulesState(tSFFile)
+    
+    modulesDir = NormalizePath(TSF_MODULES_DIR)
+    for moduleDir, moduleEnabled in modules.items():
+        modulePath = paths.get(modulesDir + "/" + moduleDir.lower())
+        
+        if not moduleEnabled and modulePath and os.path.isdir(modulePath):
+            print("    Module " + moduleDir + " is disabled: removing " + modulePath)
+            shutil.rmtree(modulePath)
 
 
 ### Start
-print("Execution mode - Download") if mode == 1 else print("Execution mode - Download & Pack to PBO")
-
-filename = DownalodAndUnzipFiles(url)
-if mode == 2:
-    PackMission(filename)
-
-print("All done! Have a nice day!")
+if __name__ == "__main__":
+    url = input("GitHub repo URL:")
+    mode = int(input("Select mode: [1] - Download, [2] - Download & pack\n"))
+    
+    print("Execution mode - Download") if mode == 1 else print("Execution mode - Download & Pack to PBO")
+    
+    filename = DownalodAndUnzipFiles(url, mode == 2)
+    
+    print("All done! Have a nice day!")
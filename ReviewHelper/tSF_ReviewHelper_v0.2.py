@@ -2,61 +2,221 @@
 # tSF Review Helper v0.2
 # -------------------------
 
-from zipfile import ZipFile
+from zipfile import ZipFile, BadZipFile, ZIP_DEFLATED
+import hashlib
+import io
+import json
 import os
+import pickle
 import shutil
 import re
-import requests
+import select
+import struct
 import sys
-import filecmp
 import time
-import yaml
+import argparse
+import atexit
+import contextlib
+import functools
+import queue
+import threading
+from collections import Counter, OrderedDict
+
+
+
+class LogWriter:
+    """
+        Writes lines to log file from background thread, keeping single open file handle.
+        Buffered lines are flushed every <flush_lines> lines or <flush_interval> seconds after previous flush.
+        Line which can't be written is reported once and skipped, writer goes on with the next ones.
+    """
+
+    def __init__(self, filename, flush_lines=100, flush_interval=1.0):
+        self.filename = filename
+        self.set_flush_policy(flush_lines, flush_interval)
+        self.failed = False
+
+        self.file = open(filename, "w", encoding="utf-8", errors="replace")
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.process, name="LogWriter", daemon=True)
+        self.thread.start()
+
+    def set_flush_policy(self, flush_lines, flush_interval):
+        # Policy may be changed while writer is running, it applies from the next written line
+        self.flush_lines = max(1, flush_lines)
+        self.flush_interval = max(0.05, flush_interval)
+
+    def write(self, line):
+        if self.thread.is_alive():
+            self.queue.put(line)
+            return
+        # Writer thread is gone, line is written synchronously (or dropped, if file is closed)
+        with self.lock:
+            if not self.file.closed:
+                self.write_line(line)
+                self.flush()
+
+    def write_line(self, line):
+        try:
+            self.file.write(line)
+        except Exception:
+            self.report_failure()
+
+    def process(self):
+        # Writer thread loop: writes queued lines until None is received
+        # Lines written since last flush and time of the first of them
+        pending = 0
+        started = 0
+        while True:
+            timeout = max(0, self.flush_interval - (time.time() - started)) if pending else None
+            try:
+                line = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                line = ""
+
+            if line is None:
+                break
+
+            with self.lock:
+                if line:
+                    if not pending:
+                        started = time.time()
+                    self.write_line(line)
+                    pending += 1
+                if pending and (pending >= self.flush_lines or time.time() - started >= self.flush_interval):
+                    self.flush()
+                    pending = 0
+
+        with self.lock:
+            self.flush()
+            self.file.close()
+
+    def flush(self):
+        try:
+            self.file.flush()
+        except Exception:
+            self.report_failure()
+
+    def report_failure(self):
+        if not self.failed:
+            self.failed = True
+            print("Error happened during log writing! [{}]".format(self.filename), file=sys.stderr)
+
+    def close(self):
+        # Writes all queued lines and closes file
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+            return
+        with self.lock:
+            if not self.file.closed:
+                self.flush()
+                self.file.close()
+
 
 
 
 class Reporter:
     """
-        Logs execution details and writes Review file with valuable data
+        Logs execution details and writes Review file with valuable data.
+        Both logs are written by buffered background writers, reporter may be used from several threads.
+        Review messages are also collected as structured finding records for JSON and SARIF output.
     """
 
-    def __init__(self):
+    SEVERITIES = {"ERR": "error", "WRN": "warning", "INFO": "note"}
+    # Meaning of review message arguments by message key (see Reporter section of config)
+    FINDING_FIELDS = {
+        "err1": ("file",),
+        "err2": ("file",),
+        "err3": ("file",),
+        "err4": ("file",),
+        "err6": ("kit", "file", "line"),
+        "err7": ("kit", "file", "line"),
+        "err8": ("file",),
+        "err9": ("kit", "file", "line"),
+        "wrn1": ("file",),
+        "wrn2": ("file",),
+        "wrn3": ("file",),
+        "info1": ("file",),
+        "info2": ("file",),
+        "info3": ("kit", "file", "line")
+    }
+
+    def __init__(self, output_dir="", quiet=False, flush_lines=100, flush_interval=1.0):
         self.verbose = True
+        self.quiet = quiet
         self.config = None
+        self.output_dir = output_dir
+        self.flush_policy = (flush_lines, flush_interval)
         self.reviewLogFile = None
+        self.reviewWriter = None
         self.msg_prefix = ""
-        self.logFile = "log.log"
-        self.log("START", "--------------------------------", "w+")
+        self.counters = {"INFO": 0, "WRN": 0, "ERR": 0}
+        self.findings = []
+        self.records = []
+        self.captured = None
+        self.lock = threading.Lock()
+        self.logFile = os.path.join(output_dir, "log.log")
+        self.logWriter = self.open_writer(self.logFile)
+        atexit.register(self.close)
+        self.log("START", "--------------------------------")
+
+    def set_flush_policy(self, flush_lines, flush_interval):
+        # Changes flush policy of both logs, including already opened ones
+        self.flush_policy = (flush_lines, flush_interval)
+        for writer in (self.logWriter, self.reviewWriter):
+            if writer:
+                writer.set_flush_policy(flush_lines, flush_interval)
+
+    def reset(self):
+        # Starts new review: forgets findings and rewrites Review.log (execution log goes on)
+        self.counters = {"INFO": 0, "WRN": 0, "ERR": 0}
+        self.findings = []
+        self.records = []
+        self.setup(self.config)
 
     def setup(self, config):
         self.config = config
-        self.reviewLogFile = "Review.log"
-        self.write_review("-------- Review started ------", "w+")
+        self.reviewLogFile = os.path.join(self.output_dir, "Review.log")
+        if self.reviewWriter:
+            self.reviewWriter.close()
+        self.reviewWriter = self.open_writer(self.reviewLogFile)
+        self.write_review("-------- Review started ------")
+
+    def open_writer(self, filename):
+        # Returns: Log writer for given file or None, if file can't be opened (LogWriter)
+        try:
+            return LogWriter(filename, *self.flush_policy)
+        except OSError:
+            print("Error happened during log writing! [{}]".format(filename))
+            return None
+
+    def close(self):
+        # Flushes and closes both logs
+        for writer in (self.logWriter, self.reviewWriter):
+            if writer:
+                writer.close()
+        atexit.unregister(self.close)
 
     def set_msg_prefix(self, prefix):
         self.msg_prefix = " " + prefix
 
-    def write_review(self, message, mode="a"):
-        try:
-            with open(self.reviewLogFile, mode) as f:
-                f.write(message + "\n")
-                f.close()
-        except:
-            self.fatal("Error happened during log writing!")
-
-    def log(self, msg_type, message, mode="a"):
-        try:
-            with open(self.logFile, mode) as f:
-                msg = "{} [{}]{} {}\n".format(
-                    time.strftime("%Y-%m-%d %H:%M:%S"),
-                    msg_type,
-                    self.msg_prefix,
-                    message
-                )
-                print(msg)
-                f.write(msg)
-                f.close()
-        except:
-            print("Error happened during log writing!")
+    def write_review(self, message):
+        if self.reviewWriter:
+            self.reviewWriter.write(message + "\n")
+
+    def log(self, msg_type, message):
+        msg = "{} [{}]{} {}\n".format(
+            time.strftime("%Y-%m-%d %H:%M:%S"),
+            msg_type,
+            self.msg_prefix,
+            message
+        )
+        if not self.quiet:
+            print(msg, end="")
+        if self.logWriter:
+            self.logWriter.write(msg)
 
     def info(self, message):
         self.log("INFO", message)
@@ -71,29 +231,334 @@ class Reporter:
         self.log("FATAL ERROR", message)
 
     def format_review_msg(self, type, code, arg1="", arg2="", arg3="", arg4=""):
+        with self.lock:
+            self.counters[type] += 1
         return "[{}] {}".format(type, self.config.get(type.lower() + str(code)).format(arg1, arg2, arg3, arg4))
 
     def review_info(self, code, arg1="", arg2="", arg3="", arg4=""):
+        self.record("INFO", code, arg1, arg2, arg3, arg4)
         if not self.verbose:
             return ()
-        self.write_review(self.format_review_msg("INFO", code, arg1, arg2, arg3, arg4))
+        self.write_finding("INFO", code, arg1, arg2, arg3, arg4)
 
     def review_warn(self, code, arg1="", arg2="", arg3="", arg4=""):
-        self.write_review(self.format_review_msg("WRN", code, arg1, arg2, arg3, arg4))
+        self.record("WRN", code, arg1, arg2, arg3, arg4)
+        self.write_finding("WRN", code, arg1, arg2, arg3, arg4)
 
     def review_error(self, code, arg1="", arg2="", arg3="", arg4=""):
-        self.write_review(self.format_review_msg("ERR", code, arg1, arg2, arg3, arg4))
-
+        self.record("ERR", code, arg1, arg2, arg3, arg4)
+        self.write_finding("ERR", code, arg1, arg2, arg3, arg4)
+
+    def write_finding(self, type, code, *args):
+        message = self.format_review_msg(type, code, *args)
+        self.findings.append(message)
+        self.records.append(self.get_finding_record(type, code, args, message))
+        self.write_review(message)
+
+    def get_finding_record(self, type, code, args, message):
+        # Returns: Structured finding - message key, severity, text and its subjects from message arguments (DICT)
+        key = type.lower() + str(code)
+        record = {"code": key, "severity": self.SEVERITIES[type], "message": message,
+                  "file": "", "line": None, "kit": "", "module": ""}
+        for field, value in zip(self.FINDING_FIELDS.get(key, ()), args):
+            record[field] = value
+        if record["file"]:
+            record["file"] = normalize_path(record["file"])
+        if record["line"] == "":
+            record["line"] = None
+        return record
+
+    def record(self, type, code, *args):
+        # Remembers review message while capturing, so it may be replayed on re-review
+        if self.captured is not None:
+            self.captured.append([type, code, list(args)])
+
+    def start_capture(self):
+        self.captured = []
+
+    def stop_capture(self):
+        # Returns: Review messages reported since capture start (LIST)
+        captured, self.captured = self.captured, None
+        return captured
+
+    def replay(self, records):
+        # Reports review messages captured before
+        methods = {"INFO": self.review_info, "WRN": self.review_warn, "ERR": self.review_error}
+        for type, code, args in records:
+            methods[type](code, *args)
+
+
+
+
+class Metrics:
+    """
+        Collects timing spans of review stages: wall time, bytes read, bytes downloaded and files touched.
+        Counters are inclusive (span includes its nested spans). Spans are exported as JSON lines or Prometheus text.
+        Disabled metrics cost single attribute check per instrumented call.
+        Counters are updated under lock, as files are read and hashed by several worker threads at once.
+    """
 
+    FORMATS = {"jsonl": "metrics.jsonl", "prom": "metrics.prom"}
+
+    def __init__(self, format=""):
+        self.enabled = bool(format)
+        self.format = format
+        self.spans = []
+        self.stack = []
+        self.bytes_read = 0
+        self.bytes_downloaded = 0
+        self.files = 0
+        self.lock = threading.Lock()
+
+    def add_read(self, size, files=1):
+        with self.lock:
+            self.bytes_read += size
+            self.files += files
+
+    def add_download(self, size):
+        with self.lock:
+            self.bytes_downloaded += size
+
+    def get_counters(self):
+        # Returns: Bytes read, bytes downloaded and files read so far (TUPLE)
+        with self.lock:
+            return self.bytes_read, self.bytes_downloaded, self.files
+
+    @contextlib.contextmanager
+    def span(self, name, label="", **attrs):
+        parent = self.stack[-1] if self.stack else ""
+        self.stack.append(name)
+        counters = self.get_counters()
+        started_at = time.time()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - started
+            self.stack.pop()
+            bytes_read, bytes_downloaded, files = self.get_counters()
+            span = {
+                "span": name, "label": label, "parent": parent, "start": round(started_at, 6),
+                "duration": round(duration, 6),
+                "bytes_read": bytes_read - counters[0],
+                "bytes_downloaded": bytes_downloaded - counters[1],
+                "files": files - counters[2]
+            }
+            span.update(attrs)
+            self.spans.append(span)
+
+    def export(self, output_dir):
+        # Writes collected spans next to Review.log
+        # Returns: Metrics file name (STRING)
+        filename = os.path.join(output_dir, self.FORMATS[self.format])
+        if self.format == "prom":
+            content = self.format_prometheus()
+        else:
+            content = "".join(json.dumps(span) + "\n" for span in self.spans)
+
+        with open(filename, "w") as f:
+            f.write(content)
+        return filename
+
+    def format_prometheus(self):
+        # Aggregates spans by name and label
+        # Returns: Prometheus text exposition (STRING)
+        totals = {}
+        for span in self.spans:
+            total = totals.setdefault((span["span"], span["label"]), [0, 0.0, 0, 0, 0])
+            total[0] += 1
+            total[1] += span["duration"]
+            total[2] += span["bytes_read"]
+            total[3] += span["bytes_downloaded"]
+            total[4] += span["files"]
+
+        metrics = [
+            ("tsf_review_span_count", "counter", "Number of spans", 0),
+            ("tsf_review_span_seconds_total", "counter", "Wall time of spans, seconds", 1),
+            ("tsf_review_span_bytes_read_total", "counter", "Bytes read from mission and reference files", 2),
+            ("tsf_review_span_bytes_downloaded_total", "counter", "Bytes downloaded", 3),
+            ("tsf_review_span_files_total", "counter", "Files read", 4)
+        ]
+        lines = []
+        for metric, kind, help, i in metrics:
+            lines.append("# HELP {} {}".format(metric, help))
+            lines.append("# TYPE {} {}".format(metric, kind))
+            for (name, label), total in sorted(totals.items()):
+                lines.append('{}{{span="{}",label="{}"}} {}'.format(metric, name, label, round(total[i], 6)))
+        return "\n".join(lines) + "\n"
+
+
+NO_METRICS = Metrics()
+
+
+def timed(name, label_arg=None, file_arg=None):
+    # Decorator: records method call as span of instance's metrics.
+    # Label (aggregated in Prometheus export) and file (JSON lines only) are taken from positional arguments.
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            metrics = self.metrics
+            if not metrics.enabled:
+                return method(self, *args, **kwargs)
+            label = str(args[label_arg]) if label_arg is not None and len(args) > label_arg else ""
+            attrs = {"file": str(args[file_arg])} if file_arg is not None and len(args) > file_arg else {}
+            with metrics.span(name, label, **attrs):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
 
 
 def strip_re(expression):
     return expression.strip('/')
 
 
+def normalize_path(path):
+    # Converts relative path to '/' separated form, regardless of OS and config (Windows) style
+    return path.replace("\\", "/").replace(os.sep, "/").strip("/")
+
+
+def read_archive_commit(archive):
+    # GitHub stores commit SHA of the archived tree in zip comment
+    # Returns: Commit SHA or empty string (STRING)
+    comment = archive.comment.decode("ascii", "ignore").strip()
+    return comment if re.fullmatch(r"[0-9a-f]{40}", comment) else ""
+
+
+def get_tmp_name(filename):
+    # Returns: Temporary name to write file to before replacing it, unique per process and thread (STRING)
+    return "{}.{}.{}.tmp".format(filename, os.getpid(), threading.get_ident())
+
+
+def link_or_copy(src, dst):
+    # Hardlinks file if filesystem allows it, copies otherwise
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+# Linux ioctl cloning file extents (reflink) on copy-on-write filesystems (Btrfs, XFS)
+FICLONE = 0x40049409
+
+
+def clone_file(src, dst):
+    # Reflinks file where filesystem supports it, otherwise hardlinks or copies it
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+
+    if fcntl and sys.platform.startswith("linux"):
+        try:
+            with open(src, "rb") as s, open(dst, "wb") as d:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            return
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.remove(dst)
+    link_or_copy(src, dst)
+
+
+def hash_stream(stream, chunk_size=64 * 1024):
+    # Returns: SHA1 hex digest of binary stream content (STRING)
+    digest = hashlib.sha1()
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+HASH_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def hash_files(hash_file, paths, workers=HASH_WORKERS):
+    # Hashes files by pool of threads (hashlib releases GIL while hashing, so reads and hashing overlap)
+    # Returns: Dict of paths to content hashes (DICT)
+    if workers < 2 or len(paths) < 2:
+        return {path: hash_file(path) for path in paths}
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+        return dict(zip(paths, pool.map(hash_file, paths)))
+
+
+def scan_tree(directory):
+    # Yields: (path, stat) of every file in directory tree
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from scan_tree(entry.path)
+            elif entry.is_file():
+                yield entry.path, entry.stat()
+
+
 class ConfigReader:
-    def __init__(self, file):
-        self.cfg = self.read_config(file)
+    """
+        Parsed config is cached in binary form next to config file and reused while config file is unchanged.
+        Patterns of cached config were validated when cache was written, so they are compiled on first use only.
+    """
+
+    CACHE_VERSION = 1
+    CACHE_SUFFIX = ".cache"
+
+    def __init__(self, file, use_cache=True):
+        self.patterns = {}
+        self.cfg = self.load_cache(file) if use_cache else None
+        if self.cfg is None:
+            self.cfg = self.read_config(file)
+            self.compile_patterns(self.cfg)
+            if use_cache:
+                self.save_cache(file)
+
+    def get_cache_stamp(self, file):
+        # Returns: Config file state the cache is valid for (TUPLE)
+        stat = os.stat(file)
+        return self.CACHE_VERSION, os.path.abspath(file), stat.st_size, stat.st_mtime_ns
+
+    def load_cache(self, file):
+        # Returns: Cached config or None if config file was changed since caching (DICT)
+        try:
+            stamp = self.get_cache_stamp(file)
+            with open(file + self.CACHE_SUFFIX, "rb") as f:
+                cached = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            return None
+
+        if not isinstance(cached, dict) or cached.get("stamp") != stamp:
+            return None
+        return cached.get("cfg")
+
+    def save_cache(self, file):
+        cache_file = file + self.CACHE_SUFFIX
+        tmp_name = get_tmp_name(cache_file)
+        try:
+            with open(tmp_name, "wb") as f:
+                pickle.dump({"stamp": self.get_cache_stamp(file), "cfg": self.cfg}, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_name, cache_file)
+        except OSError:
+            pass
+
+    def compile_patterns(self, value):
+        # Compiles every /regex/ value of config once, so scanners never recompile patterns
+        if isinstance(value, dict):
+            value = value.values()
+        elif not isinstance(value, list):
+            if isinstance(value, str) and len(value) > 1 and value[0] == value[-1] == "/":
+                self.compile_re(value)
+            return
+
+        for item in value:
+            self.compile_patterns(item)
+
+    def compile_re(self, expression):
+        # Returns: Compiled case-insensitive pattern for /regex/ string (Pattern)
+        pattern = self.patterns.get(expression)
+        if pattern is None:
+            try:
+                pattern = re.compile(strip_re(expression), re.I)
+            except re.error as e:
+                raise ValueError("Malformed pattern [{}]: {}".format(expression, e)) from None
+            self.patterns[expression] = pattern
+        return pattern
 
     def read_config(self, filename):
         # Check that config file exists and reads it data to dictionary
@@ -101,6 +566,8 @@ class ConfigReader:
         if not os.path.isfile(filename):
             raise FileNotFoundError()
 
+        # Imported on cache miss only, to keep startup fast
+        import yaml
         try:
             with open(filename, "r") as yamlfile:
                 cfg = yaml.load(yamlfile, Loader=yaml.BaseLoader)
@@ -136,88 +603,1020 @@ class ConfigReader:
         # Get value by key and strip regex from escape symbols
         return strip_re(self.get_by_key(key))
 
+    def get_pattern(self, key):
+        # Returns: Precompiled pattern by key (Pattern)
+        return self.compile_re(self.get_by_key(key))
+
+
+
+
+def load_config(filename):
+    # Reads config file, reporting missing or malformed config in the same way for all run modes
+    # Returns: Config or None and error message or empty string (TUPLE)
+    try:
+        return ConfigReader(filename), ""
+    except FileNotFoundError:
+        return None, "Could not find config file [" + filename + "]!"
+    except ValueError:
+        return None, "Could not read config file! File is malformed!"
+
+
+
+
+class ArchiveCache:
+    """
+        On-disk cache of mission archives, shared with MissionDownloader (same directory layout).
+        Entry per archive URL (repo and branch): <sha1 of URL>.zip and <sha1 of URL>.json with ETag and commit SHA.
+        Cached archive is revalidated with If-None-Match, least recently used archives are evicted by total size.
+    """
+
+    ARCHIVE_SUFFIX = ".zip"
+    META_SUFFIX = ".json"
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def get_entry_name(self, url):
+        # Returns: Path of cache entry without suffix (STRING)
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode()).hexdigest())
+
+    def get(self, url):
+        # Returns: Metadata of cached archive or None (DICT)
+        name = self.get_entry_name(url)
+        try:
+            with open(name + self.META_SUFFIX, "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if meta.get("url") != url or not meta.get("etag") or not os.path.isfile(name + self.ARCHIVE_SUFFIX):
+            return None
+        return meta
+
+    def get_headers(self, url):
+        # Returns: Headers of conditional request for archive URL (DICT)
+        meta = self.get(url)
+        return {"If-None-Match": meta["etag"]} if meta else {}
+
+    def restore(self, url, filename):
+        # Places cached archive to filename and marks entry as recently used
+        # Returns: True if archive was restored (BOOL)
+        archive = self.get_entry_name(url) + self.ARCHIVE_SUFFIX
+        try:
+            os.utime(archive)
+            if os.path.isfile(filename):
+                os.remove(filename)
+            link_or_copy(archive, filename)
+        except OSError:
+            return False
+        return True
+
+    def put(self, url, filename, etag):
+        # Stores downloaded archive. Archive is replaced before metadata, so interrupted update only costs a download.
+        if not etag:
+            return
+
+        name = self.get_entry_name(url)
+        tmp_name = get_tmp_name(name)
+        try:
+            with ZipFile(filename, "r") as archive:
+                commit = read_archive_commit(archive)
+        except (OSError, BadZipFile):
+            return
+
+        meta = {"url": url, "etag": etag, "commit": commit, "size": os.path.getsize(filename), "stored": time.time()}
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            link_or_copy(filename, tmp_name)
+            os.replace(tmp_name, name + self.ARCHIVE_SUFFIX)
+            with open(tmp_name, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp_name, name + self.META_SUFFIX)
+        except OSError:
+            return
+        self.evict()
+
+    def evict(self):
+        # Removes least recently used archives until cache fits max_size
+        entries = []
+        with os.scandir(self.cache_dir) as files:
+            for entry in files:
+                if entry.name.endswith(self.ARCHIVE_SUFFIX) and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            for name in (path, path[:-len(self.ARCHIVE_SUFFIX)] + self.META_SUFFIX):
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+            total -= size
+
 
 
 
 class Downloader:
     """
-        Downloads mission archive from GitHub website, unzips and rename folder (removing branch suffix)
+        Downloads mission archive from GitHub website (archive is reviewed without extracting, see ZipMissionFiles)
     """
 
     BRANCH_MAIN = "main"
     BRANCH_MASTER = "master"
     URL_FORMAT = "{}/archive/{}.zip"
 
-    def __init__(self, reporter):
-        self.reporter = reporter
+    CHUNK_SIZE = 64 * 1024
+    PROGRESS_STEP = 1024 * 1024
+    PARTIAL_SUFFIX = ".part"
+    # ETag of archive being downloaded to partial file, resume is only valid while archive has the same ETag
+    PARTIAL_ETAG_SUFFIX = ".etag"
 
-    def download(self, url):
-        # Validates URL (is reachable) and downloads mission, unzip it
-        # Returns: Created mission folder name (STRING)
+    # Resolved branch per repo URL, shared by all downloaders of the process
+    branch_cache = {}
+
+    def __init__(self, reporter, session=None, download_dir="", metrics=NO_METRICS, cache=None):
+        # Imported by downloaders only, local reviews never need HTTP client
+        import requests
+        self.reporter = reporter
+        # Session given by caller is shared with other downloaders and is closed by its owner
+        self.own_session = session is None
+        self.session = session or requests.Session()
+        self.download_dir = download_dir
+        self.metrics = metrics
+        self.cache = cache
+
+    @timed("Downloader.download_archive")
+    def download_archive(self, url):
+        # Resolves archive branch and downloads mission archive (probe response is reused as download stream)
+        # Returns: Downloaded archive name or empty string (STRING)
 
         self.reporter.info("Downloading mission: " + url)
 
-        file_url = self.get_file_url(url)
+        file_url, response = self.get_file_url(url)
         if not file_url:
             return ""
 
-        zip_request = requests.get(file_url, allow_redirects=True)
-        file_name_parts = file_url.rsplit('/', 3)
-        filename = "{}-{}".format(file_name_parts[1], file_name_parts[3])
-
+        filename = self.get_archive_name(file_url)
         if os.path.isfile(filename):
             os.remove(filename)
 
-        with open(filename, "wb") as file:
-            file.write(zip_request.content)
-            file.close()
+        if not self.fetch_archive(file_url, filename, response):
+            self.reporter.error("Mission repo download failed!")
+            return ""
 
-        self.reporter.info("Mission repo downloaded, unzipping.")
-        self.unzip(filename)
-        dir_name = self.rename_folder(filename)
-        self.reporter.info("Mission repo unpacked.")
+        return filename
 
-        return dir_name
+    def get_archive_name(self, file_url):
+        # Returns: Local archive name in format Repo-branch.zip, placed in download directory (STRING)
+        file_name_parts = file_url.rsplit('/', 3)
+        return os.path.join(self.download_dir, "{}-{}".format(file_name_parts[1], file_name_parts[3]))
+
+    def request_archive(self, file_url, filename, conditional=True):
+        # Opens streamed GET request for archive, asking for the rest of the partial file if there is one,
+        # or for changes since cached archive (304 Not Modified if there are none).
+        # Range is conditional (If-Range), so server sends whole new archive (200) if it was changed since
+        # partial file was started. Partial file of unknown ETag can't be validated and is dropped.
+        # Only response headers are read here, so the request also serves as a cheap branch probe.
+        # Returns: Response and offset of the requested range (TUPLE)
+        partial_name = filename + self.PARTIAL_SUFFIX
+        offset = os.path.getsize(partial_name) if os.path.isfile(partial_name) else 0
+        etag = self.read_partial_etag(partial_name) if offset else ""
+        if offset and not etag:
+            self.remove_partial(partial_name)
+            offset = 0
+
+        if offset:
+            headers = {"Range": "bytes={}-".format(offset), "If-Range": etag}
+        else:
+            headers = self.cache.get_headers(file_url) if self.cache and conditional else {}
 
-    def get_file_url(self, repo_url):
-        # Tries to get mission archive URL, as it may have -main or -master suffix - check both and return valid one
-        # Returns: Reachable URL of empty string (STRING)
-        url = self.URL_FORMAT.format(repo_url, self.BRANCH_MAIN)
-        if self.validate_repo(url):
-            return url
+        return self.session.get(file_url, headers=headers, stream=True, allow_redirects=True), offset
 
-        url = self.URL_FORMAT.format(repo_url, self.BRANCH_MASTER)
-        if self.validate_repo(url):
-            return url
+    def read_partial_etag(self, partial_name):
+        # Returns: ETag of archive partial file belongs to or empty string (STRING)
+        try:
+            with open(partial_name + self.PARTIAL_ETAG_SUFFIX, "r") as f:
+                return f.read().strip()
+        except OSError:
+            return ""
+
+    def save_partial_etag(self, partial_name, etag):
+        # Remembers ETag of archive started downloading. Weak ETags can't be used in If-Range, so they are not saved.
+        if etag and not etag.startswith("W/"):
+            with open(partial_name + self.PARTIAL_ETAG_SUFFIX, "w") as f:
+                f.write(etag)
+        elif os.path.isfile(partial_name + self.PARTIAL_ETAG_SUFFIX):
+            os.remove(partial_name + self.PARTIAL_ETAG_SUFFIX)
+
+    def remove_partial(self, partial_name):
+        for name in (partial_name, partial_name + self.PARTIAL_ETAG_SUFFIX):
+            with contextlib.suppress(OSError):
+                os.remove(name)
+
+    def fetch_archive(self, file_url, filename, response=None):
+        # Streams archive to disk by chunks of CHUNK_SIZE bytes, so whole archive is never kept in memory.
+        # Partially downloaded archive (*.part) is resumed with HTTP range request, if server supports it.
+        # Already opened response (e.g. from branch probe) is consumed instead of making new request.
+        # Returns: True if archive was downloaded completely (BOOL)
+        partial_name = filename + self.PARTIAL_SUFFIX
 
-        return ""
+        try:
+            if response is None:
+                response, offset = self.request_archive(file_url, filename)
+            else:
+                offset = os.path.getsize(partial_name) if os.path.isfile(partial_name) else 0
+
+            with response:
+                if response.status_code == 304:
+                    response.close()
+                    if self.cache.restore(file_url, filename):
+                        self.reporter.info("Mission archive is not changed, using cached copy.")
+                        return True
+                    return self.fetch_archive(file_url, filename, self.request_archive(file_url, filename, False)[0])
+
+                if offset and response.status_code == 416:
+                    # Partial file is not consistent with remote archive - download from scratch
+                    self.reporter.warn("Failed to resume download, restarting.")
+                    response.close()
+                    self.remove_partial(partial_name)
+                    return self.fetch_archive(file_url, filename)
+
+                if response.status_code not in (200, 206):
+                    self.reporter.error("Unexpected response [{}] for {}".format(response.status_code, file_url))
+                    return False
+
+                etag = response.headers.get("ETag")
+                if response.status_code == 200:
+                    # Server ignores range requests or archive was changed - download from scratch
+                    offset = 0
+                    self.save_partial_etag(partial_name, etag)
+                else:
+                    self.reporter.info("Resuming download from {} bytes.".format(offset))
+
+                total = int(response.headers.get("Content-Length", 0))
+                if total:
+                    total += offset
+
+                done = offset
+                next_report = done + self.PROGRESS_STEP
+                with open(partial_name, "ab" if offset else "wb") as file:
+                    for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                        file.write(chunk)
+                        done += len(chunk)
+                        if self.metrics.enabled:
+                            self.metrics.add_download(len(chunk))
+                        if done >= next_report:
+                            self.report_progress(done, total)
+                            next_report = done + self.PROGRESS_STEP
+        except (self.get_request_error(), OSError) as e:
+            self.reporter.error("Download interrupted: {}".format(e))
+            return False
+
+        if total and done < total:
+            self.reporter.error("Download incomplete: {} of {} bytes.".format(done, total))
+            return False
+
+        self.report_progress(done, total)
+        os.replace(partial_name, filename)
+        self.remove_partial(partial_name)
+        if self.cache:
+            self.cache.put(file_url, filename, etag)
+        return True
+
+    @staticmethod
+    def get_request_error():
+        # Returns: Base exception of HTTP client (CLASS)
+        import requests
+        return requests.RequestException
+
+    def report_progress(self, done, total):
+        # Reports downloaded size (and percent, if archive size is known)
+        if total:
+            self.reporter.info("Downloaded {:.1f} of {:.1f} MB ({}%)".format(
+                done / 1048576, total / 1048576, done * 100 // total
+            ))
+        else:
+            self.reporter.info("Downloaded {:.1f} MB".format(done / 1048576))
+
+    def get_file_url(self, repo_url):
+        # Tries to get mission archive URL, as it may have -main or -master suffix - probes both (cached branch first)
+        # and returns valid one along with its open response, so archive body is downloaded only once
+        # Returns: Reachable URL of empty string and open response or None (TUPLE)
+        branches = [self.BRANCH_MAIN, self.BRANCH_MASTER]
+        cached = self.branch_cache.get(repo_url)
+        if cached is None and self.cache:
+            cached = next((b for b in branches if self.cache.get(self.URL_FORMAT.format(repo_url, b))), None)
+        if cached in branches:
+            branches.remove(cached)
+            branches.insert(0, cached)
+
+        for branch in branches:
+            url = self.URL_FORMAT.format(repo_url, branch)
+            response = self.validate_repo(url)
+            if response is not None:
+                self.branch_cache[repo_url] = branch
+                return url, response
+
+        self.branch_cache.pop(repo_url, None)
+        return "", None
 
     def validate_repo(self, url):
-        # Checks that given URL is reachable
-        request = requests.get(url)
-        return request.status_code == 200
+        # Checks that given URL is reachable, reading headers only
+        # Returns: Open response to be consumed or None if URL is unreachable
+        try:
+            response, offset = self.request_archive(url, self.get_archive_name(url))
+        except self.get_request_error() as e:
+            self.reporter.warn("Failed to reach {}: {}".format(url, e))
+            return None
+
+        if response.status_code in (200, 206, 304) or (offset and response.status_code == 416):
+            return response
+
+        # Drain short error body, so connection goes back to the session pool
+        response.content
+        response.close()
+        return None
+
+    def close(self):
+        # Releases pooled connections of own session
+        if self.own_session:
+            self.session.close()
 
     def unzip(self, filename):
         # Unzips given archive
         try:
             with ZipFile(filename, "r") as file:
-                file.extractall()
+                file.extractall(self.download_dir or None)
             os.remove(filename)
         except:
             self.reporter.fatal("Unzipping failed!")
 
-    def rename_folder(self, filename):
-        # Rename unzipped folder and remove branch suffix (main or master)
-        # Returns: new folder name (STRING)
 
-        old_name = filename.rstrip(".zip")
-        new_name = (old_name.split("-{}".format(self.BRANCH_MAIN))[0]).split("-{}".format(self.BRANCH_MASTER))[0]
-        if os.path.isdir(new_name):
-            shutil.rmtree(new_name)
 
-        os.rename(old_name, new_name)
 
-        return new_name
+FILE_CACHE_SIZE = 32 * 1024 * 1024
+
+
+class FileCache:
+    """
+        Content of files read during single review: each file is read once, its content, decoded text and hash
+        are shared by all checks. Content is held up to <max_size> bytes and least recently used files are evicted
+        first; files larger than quarter of the cap (assets) are never held. Hashes are kept for all files.
+    """
+
+    def __init__(self, max_size=FILE_CACHE_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        # Key -> [content, decoded text or None]
+        self.entries = OrderedDict()
+        self.hashes = {}
+        self.hits = 0
+        self.reads = 0
+        self.lock = threading.Lock()
+
+    def can_hold(self, size):
+        return size <= self.max_size // 4
+
+    def get(self, key):
+        # Returns: Cached entry [content, text] or None (LIST)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            return entry
+
+    def put(self, key, content):
+        # Returns: Entry of given content, held by cache if it fits (LIST)
+        entry = [content, None]
+        with self.lock:
+            self.reads += 1
+            if not self.can_hold(len(content)):
+                return entry
+            if key in self.entries:
+                return self.entries[key]
+            self.entries[key] = entry
+            self.size += len(content)
+            self.evict()
+        return entry
+
+    def set_text(self, key, entry, text):
+        with self.lock:
+            entry[1] = text
+            if self.entries.get(key) is entry:
+                self.size += len(text)
+                self.evict()
+
+    def evict(self):
+        # Removes least recently used entries until cache fits its cap
+        while self.size > self.max_size and self.entries:
+            _, (content, text) = self.entries.popitem(last=False)
+            self.size -= len(content) + (len(text) if text is not None else 0)
+
+    def get_hash(self, key):
+        with self.lock:
+            return self.hashes.get(key)
+
+    def discard(self, key):
+        # Forgets content and hash of changed file
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.size -= len(entry[0]) + (len(entry[1]) if entry[1] is not None else 0)
+            self.hashes.pop(key, None)
+
+    def set_hash(self, key, file_hash):
+        with self.lock:
+            self.hashes[key] = file_hash
+
+
+
+
+class MissionFiles:
+    """
+        Provides read access to mission files stored in directory.
+        Files are looked up by index of the whole tree, built once and keyed by normalized lowercase relative path,
+        so config paths with Windows separators are found on any OS and in any letter case.
+        Files are read through file cache, so repeated reads and hashing of the same file don't touch the disk.
+    """
+
+    def __init__(self, root, metrics=NO_METRICS, cache=None, paths=None):
+        self.root = root
+        self.metrics = metrics
+        self.cache = cache or FileCache()
+        self.paths = paths
+        # Commit SHA of the files, if known (local directories may contain uncommitted changes)
+        self.commit = ""
+
+    def get_path(self, filename):
+        # Returns: Path to file or empty string, if file not exists (STRING)
+        if self.paths is None:
+            self.paths = self.index_paths()
+        return self.paths.get(normalize_path(filename).lower(), "")
+
+    def index_paths(self):
+        # Returns: Dict of normalized lowercase relative paths to file paths (DICT)
+        paths = {}
+        for key, path, _ in self.list_files():
+            paths.setdefault(key.lower(), path)
+        return paths
+
+    def update_paths(self, keys):
+        # Forgets cached content of changed files and updates path index for created and removed files
+        # Returns: Dict of changed keys to their paths, empty for removed files (DICT)
+        if self.paths is None:
+            self.paths = self.index_paths()
+
+        changed = {}
+        current = None
+        for key in keys:
+            old_path = self.paths.pop(key.lower(), None)
+            path = old_path or os.path.join(self.root, *key.split("/"))
+            if not os.path.isfile(path):
+                # Names of files made on Windows may contain backslashes, such files are found by listing the tree
+                if current is None:
+                    current = self.index_paths()
+                path = current.get(key.lower(), "")
+            for cached in {path, old_path} - {None, ""}:
+                self.cache.discard((self.root, cached))
+            changed[key] = path
+            if path:
+                self.paths[key.lower()] = path
+        return changed
+
+    def open(self, path, mode="r"):
+        self.track_read(path)
+        return open(path, mode)
+
+    def track_read(self, path):
+        if self.metrics.enabled:
+            self.metrics.add_read(self.size(path))
+
+    def size(self, path):
+        return os.path.getsize(path)
+
+    def read(self, path):
+        # Returns: File content (BYTES)
+        return self.get_entry(path)[0]
+
+    def read_text(self, path):
+        # Returns: File content decoded as UTF-8, undecodable bytes are replaced (STRING)
+        entry = self.get_entry(path)
+        if entry[1] is None:
+            self.cache.set_text((self.root, path), entry, entry[0].decode("utf-8", "replace"))
+        return entry[1]
+
+    def get_entry(self, path):
+        # Returns: File cache entry, reading file if it is not cached (LIST)
+        key = (self.root, path)
+        entry = self.cache.get(key)
+        if entry is None:
+            with self.open(path, "rb") as f:
+                entry = self.cache.put(key, f.read())
+        return entry
+
+    def hash(self, path):
+        # Returns: Content hash of file, large files are hashed by chunks without holding their content (STRING)
+        key = (self.root, path)
+        file_hash = self.cache.get_hash(key)
+        if file_hash is None:
+            if self.cache.can_hold(self.size(path)):
+                file_hash = hashlib.sha1(self.read(path)).hexdigest()
+            else:
+                with self.open(path, "rb") as f:
+                    file_hash = hash_stream(f)
+            self.cache.set_hash(key, file_hash)
+        return file_hash
+
+    def list_files(self):
+        # Yields: (normalized relative path, path, size) of every mission file
+        for path, stat in scan_tree(self.root):
+            yield normalize_path(os.path.relpath(path, self.root)), path, stat.st_size
+
+    def get_key(self, path):
+        # Returns: Normalized path relative to mission root (STRING)
+        return normalize_path(os.path.relpath(path, self.root))
+
+    def get_stamp(self, path):
+        # Returns: File state changing along with its content - size and modification time (LIST)
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def copy(self, path, destination):
+        # Reflinks, hardlinks or copies file, so its content is not read where filesystem allows it
+        clone_file(path, destination)
+
+    def write_to(self, path, stream):
+        # Writes file content to binary stream, from file cache if it is there
+        entry = self.cache.get((self.root, path))
+        if entry is not None:
+            stream.write(entry[0])
+            return
+        with self.open(path, "rb") as src:
+            shutil.copyfileobj(src, stream)
+
+    def close(self):
+        pass
+
+
+class ZipMissionFiles(MissionFiles):
+    """
+        Provides read access to mission files directly from archive members, without extracting archive to disk
+    """
+
+    def __init__(self, archive, metrics=NO_METRICS, cache=None):
+        super().__init__(archive, metrics, cache)
+        self.archive = ZipFile(archive, "r")
+        self.members = self.index_members()
+        self.keys = {name: key for key, name in self.members.items()}
+        self.paths = self.index_paths()
+        self.commit = self.read_commit()
+
+    def read_commit(self):
+        # Returns: Commit SHA or empty string (STRING)
+        return read_archive_commit(self.archive)
+
+    def index_members(self):
+        # Maps file path relative to mission root (GitHub archive has single top folder Repo-branch) to member name
+        # Returns: Dict of paths (STRING) to member names (STRING)
+        names = [info.filename for info in self.archive.infolist() if not info.is_dir()]
+        top_dirs = {name.split("/", 1)[0] for name in names}
+        strip_top = len(top_dirs) == 1 and all("/" in name for name in names)
+
+        return {(name.split("/", 1)[1] if strip_top else name): name for name in names}
+
+    def open(self, path, mode="r"):
+        self.track_read(path)
+        member = self.archive.open(path)
+        if "b" in mode:
+            return member
+        return io.TextIOWrapper(member)
+
+    def size(self, path):
+        return self.archive.getinfo(path).file_size
+
+    def list_files(self):
+        for key, name in self.members.items():
+            yield key, name, self.archive.getinfo(name).file_size
+
+    def get_key(self, path):
+        return self.keys.get(path, path)
+
+    def get_stamp(self, path):
+        # Archive members carry CRC of their content
+        info = self.archive.getinfo(path)
+        return [info.file_size, info.CRC]
+
+    def copy(self, path, destination):
+        with open(destination, "wb") as dst:
+            self.write_to(path, dst)
+
+    def close(self):
+        self.archive.close()
+
+
+
+
+class ReferenceIndex:
+    """
+        Persistent manifest of reference directory: normalized path -> size and content hash.
+        Entries are re-hashed only when file size or modification time changes.
+    """
+
+    VERSION = 1
+
+    def __init__(self, root, manifest_file, cached=None):
+        # cached - entries of index built before, manifest file is loaded if not given
+        self.root = root
+        self.manifest_file = manifest_file
+        self.files = {}
+        self.paths = {}
+        self.dirty = False
+
+        self.build(self.load() if cached is None else cached)
+        if self.dirty:
+            self.save()
+
+    def refresh(self):
+        # Re-validates index by stat of reference tree, files with changed size or mtime are re-hashed.
+        # Index is not modified, so reviews using it are not affected.
+        # Returns: Rebuilt index or this index, if reference files are not changed (ReferenceIndex)
+        index = ReferenceIndex(self.root, self.manifest_file, self.files)
+        return self if index.files == self.files else index
+
+    def load(self):
+        # Returns: Previously saved manifest entries or empty dict (DICT)
+        if not self.manifest_file or not os.path.isfile(self.manifest_file):
+            return {}
+
+        try:
+            with open(self.manifest_file, "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        if manifest.get("version") != self.VERSION or manifest.get("root") != os.path.abspath(self.root):
+            return {}
+        return manifest.get("files", {})
+
+    def save(self):
+        manifest = {"version": self.VERSION, "root": os.path.abspath(self.root), "files": self.files}
+        tmp_name = get_tmp_name(self.manifest_file)
+        try:
+            with open(tmp_name, "w") as f:
+                json.dump(manifest, f)
+            os.replace(tmp_name, self.manifest_file)
+            self.dirty = False
+        except OSError:
+            pass
+
+    def build(self, cached):
+        # Walks reference tree, reusing cached hashes of files with unchanged size and mtime.
+        # Changed files are hashed in parallel. Paths of files are kept for lookups (see MissionFiles).
+        changed = {}
+        for path, stat in scan_tree(self.root):
+            key = normalize_path(os.path.relpath(path, self.root))
+            self.paths.setdefault(key.lower(), path)
+            entry = cached.get(key)
+            if not entry or entry[0] != stat.st_size or entry[1] != stat.st_mtime_ns:
+                entry = [stat.st_size, stat.st_mtime_ns, ""]
+                changed[path] = entry
+            self.files[key] = entry
+
+        if changed:
+            for path, file_hash in hash_files(self.hash_file, list(changed)).items():
+                changed[path][2] = file_hash
+            self.dirty = True
+
+        if len(self.files) != len(cached):
+            self.dirty = True
+
+    @staticmethod
+    def hash_file(path):
+        with open(path, "rb") as f:
+            return hash_stream(f)
+
+    def get(self, path):
+        # Returns: (size, hash) of given reference file or None if not indexed (TUPLE)
+        entry = self.files.get(normalize_path(os.path.relpath(path, self.root)))
+        if not entry:
+            return None
+        return entry[0], entry[2]
+
+
+
+
+class ReferenceVersions:
+    """
+        Registered tSF reference versions: reference_path plus every directory of reference_versions,
+        each with its own persistent hash index (<reference_versions>/<name>.manifest.json).
+        Mission is matched to the closest version by Jaccard similarity of (path, hash) sets of framework files.
+    """
+
+    MANIFEST_FORMAT = "{}.manifest.json"
+
+    def __init__(self, default_root, default_manifest, versions_dir="", indexes=None):
+        # indexes - already built indexes of versions, reference directories are indexed if not given
+        self.default = os.path.basename(os.path.normpath(default_root))
+        self.sources = (default_root, default_manifest, versions_dir)
+        self.indexes = indexes
+        if indexes is None:
+            self.indexes = {self.default: ReferenceIndex(default_root, default_manifest)}
+            if versions_dir and os.path.isdir(versions_dir):
+                with os.scandir(versions_dir) as entries:
+                    for entry in sorted(entries, key=lambda e: e.name):
+                        if entry.is_dir() and entry.name not in self.indexes:
+                            manifest = os.path.join(versions_dir, self.MANIFEST_FORMAT.format(entry.name))
+                            self.indexes[entry.name] = ReferenceIndex(entry.path, manifest)
+
+        # Fingerprints of versions and sizes of every framework file across versions
+        self.fingerprints = {}
+        self.sizes = {}
+        for name, index in self.indexes.items():
+            self.fingerprints[name] = {(key.lower(), entry[2]) for key, entry in index.files.items()}
+            for key, entry in index.files.items():
+                self.sizes.setdefault(key, set()).add(entry[0])
+
+    @staticmethod
+    def from_config(cfg):
+        # Returns: Reference versions registered in config (ReferenceVersions)
+        try:
+            versions_dir = cfg.get("reference_versions")
+        except ValueError:
+            versions_dir = ""
+        return ReferenceVersions(cfg.get("reference_path"), cfg.get("reference_manifest"), versions_dir)
+
+    def get(self, name):
+        # Returns: Index of reference version (ReferenceIndex)
+        return self.indexes[name]
+
+    def refresh(self):
+        # Returns: Versions with re-validated indexes, or these versions if reference files are not changed
+        # (ReferenceVersions)
+        indexes = {name: index.refresh() for name, index in self.indexes.items()}
+        if all(indexes[name] is index for name, index in self.indexes.items()):
+            return self
+        return ReferenceVersions(*self.sources, indexes)
+
+    def match(self, fingerprint):
+        # Returns: Versions with their similarity to mission fingerprint, the closest first (LIST of TUPLEs)
+        scores = []
+        for name, version in self.fingerprints.items():
+            union = len(fingerprint | version)
+            scores.append((name, len(fingerprint & version) / union if union else 0.0))
+        scores.sort(key=lambda score: (-score[1], score[0] != self.default, score[0]))
+        return scores
+
+class SQFTokenizer:
+    """
+        Tokenizer for SQF subset used by dzn_gear and tSF settings: comments, strings, identifiers, numbers and symbols
+    """
+
+    TOKEN_RE = re.compile(r"""
+        (?P<newline>\n)
+        |(?P<space>[ \t\r\f\v]+)
+        |(?P<line_comment>//[^\n]*)
+        |(?P<block_comment>/\*.*?(?:\*/|\Z))
+        |(?P<string>"(?:[^"]|"")*"|'(?:[^']|'')*')
+        |(?P<identifier>[A-Za-z_]\w*)
+        |(?P<number>\$[0-9A-Fa-f]+|0x[0-9A-Fa-f]+|\d+(?:\.\d*)?(?:e[+-]?\d+)?)
+        |(?P<symbol>.)
+    """, re.S | re.X)
+    COMMENT_RE = re.compile(r"""("(?:[^"]|"")*"|'(?:[^']|'')*')|(//[^\n]*|/\*.*?(?:\*/|\Z))""", re.S)
+
+    def tokenize(self, text, commented=False, line=1):
+        # Content of comments is tokenized too, with commented flag set
+        # Yields: (type, value, line, commented) for each significant token (TUPLE)
+        for m in self.TOKEN_RE.finditer(text):
+            kind = m.lastgroup
+            value = m.group()
+
+            if kind == "newline":
+                line += 1
+                continue
+            if kind == "space":
+                continue
+
+            if kind == "line_comment":
+                yield from self.tokenize(value[2:], True, line)
+            elif kind == "block_comment":
+                yield from self.tokenize(value[2:-2] if value.endswith("*/") else value[2:], True, line)
+            else:
+                yield kind, value, line, commented
+
+            line += value.count("\n")
+
+    def strip_comments(self, text):
+        # Blanks out comments keeping line breaks, so line based matching sees code only and line numbers are kept
+        # Returns: Text without comments (STRING)
+        return self.COMMENT_RE.sub(self.blank_comment, text)
+
+    def blank_comment(self, m):
+        if m.group(1):
+            return m.group(1)
+        return "\n" * m.group(2).count("\n")
+
+
+
+
+class KitIndex:
+    """
+        Inverted index of dzn_gear kits found in mission code: definitions (kit_name = ...), references to kits
+        (identifiers and "kit_name" strings), their files, source lines and comment state.
+        Kits found in each file are kept, so changed file is re-tokenized alone and index is merged from kept files.
+    """
+
+    def __init__(self, kit_pattern):
+        self.kit_pattern = kit_pattern
+        self.tokenizer = SQFTokenizer()
+        # File -> kits found in file: definitions and references, both lists of (name, line, commented)
+        self.files = {}
+        # References added by custom patterns: (name, file, line)
+        self.added_references = []
+        self.definitions = {}
+        self.commented_definitions = {}
+        self.definition_files = {}
+        # Kit name -> list of (file, line, commented)
+        self.references = {}
+
+    def is_kit_name(self, name):
+        return self.kit_pattern.fullmatch(name) is not None
+
+    def add_file(self, text, file=""):
+        # Indexes kits defined and referenced in given SQF code, replacing kits indexed for the file before
+        tokens = list(self.tokenizer.tokenize(text))
+        definitions, references = [], []
+
+        for i, (kind, value, line, commented) in enumerate(tokens):
+            if kind == "string":
+                value = value[1:-1]
+                if not self.is_kit_name(value):
+                    continue
+            elif kind != "identifier" or not self.is_kit_name(value):
+                continue
+
+            name = value.lower()
+            if kind == "identifier" and self.is_assignment(tokens, i, commented):
+                definitions.append((name, line, commented))
+            else:
+                references.append((name, line, commented))
+
+        replaced = file in self.files
+        self.files[file] = (definitions, references)
+        if replaced:
+            self.remove_added_references(file)
+            self.merge()
+        else:
+            self.merge_file(file, definitions, references)
+
+    def remove_file(self, file):
+        # Drops kits of removed file from index
+        if file in self.files:
+            del self.files[file]
+            self.remove_added_references(file)
+            self.merge()
+
+    def remove_added_references(self, file):
+        self.added_references = [ref for ref in self.added_references if ref[1] != file]
+
+    def merge(self):
+        # Rebuilds index from kits of all files, in order files were added (first definition of kit wins)
+        self.definitions = {}
+        self.commented_definitions = {}
+        self.definition_files = {}
+        self.references = {}
+        for file, (definitions, references) in self.files.items():
+            self.merge_file(file, definitions, references)
+        for name, file, line in self.added_references:
+            self.references.setdefault(name, []).append((file, line, False))
+
+    def merge_file(self, file, definitions, references):
+        for name, line, commented in definitions:
+            kits = self.commented_definitions if commented else self.definitions
+            if name not in kits:
+                kits[name] = line
+                if not commented:
+                    self.definition_files[name] = file
+        for name, line, commented in references:
+            self.references.setdefault(name, []).append((file, line, commented))
+
+    def add_reference(self, name, file, line):
+        # Adds reference to kit found by custom pattern
+        self.added_references.append((name.lower(), file, line))
+        self.references.setdefault(name.lower(), []).append((file, line, False))
+
+    def is_assignment(self, tokens, i, commented):
+        # Returns: True if identifier at i is followed by '=' (but not '==') within same comment state (BOOL)
+        following = [t for t in tokens[i + 1:i + 3] if t[3] == commented]
+        return (
+            len(following) > 0 and following[0][0] == "symbol" and following[0][1] == "="
+            and not (len(following) > 1 and following[1][1] == "=")
+        )
+
+    def is_defined(self, name):
+        return name.lower() in self.definitions
+
+    def get_definition_line(self, name):
+        # Returns: Line of active definition or None (INT)
+        return self.definitions.get(name.lower())
+
+    def get_commented_line(self, name):
+        # Returns: Line of commented out definition or None (INT)
+        return self.commented_definitions.get(name.lower())
+
+    def get_file_references(self, file):
+        # Returns: Active references to kits in file in order of appearance (LIST of TUPLEs (name, line))
+        file = file.lower()
+        found = [
+            (line, name)
+            for name, references in self.references.items()
+            for ref_file, line, commented in references
+            if not commented and ref_file.lower() == file
+        ]
+        return [(name, line) for line, name in sorted(found)]
+
+    def get_unknown(self):
+        # Returns: Active references to kits, which are not defined anywhere (DICT of name -> LIST of (file, line))
+        unknown = {}
+        for name, references in self.references.items():
+            if name in self.definitions:
+                continue
+            active = [(ref_file, line) for ref_file, line, commented in references if not commented]
+            if active:
+                unknown[name] = active
+        return unknown
+
+    def get_unused(self):
+        # Returns: Defined kits, which are never referenced outside of commented code (LIST)
+        return sorted(
+            name for name in self.definitions
+            if not any(not commented for _, _, commented in self.references.get(name, []))
+        )
+
+    def get_digest(self):
+        # Returns: Hash of defined and commented out kits, changing whenever kit check results may change (STRING)
+        parts = sorted(self.definitions) + ["#" + name for name in sorted(self.commented_definitions)]
+        return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+
+
+class PatternScanner:
+    """
+        Matches all patterns registered for a file in single pass over its lines.
+        Patterns are grouped by file, each file is read once - on first request of its matches.
+        With strip_comments SQF comments are blanked out before matching, so commented code is not matched.
+    """
+
+    def __init__(self, files, strip_comments=False):
+        self.files = files
+        self.strip_comments = strip_comments
+        self.tokenizer = SQFTokenizer()
+        self.plan = {}
+        self.results = {}
+
+    def add(self, path, name, pattern):
+        # Registers compiled pattern under given name for file
+        patterns = self.plan.setdefault(path, {})
+        if name in patterns and patterns[name] is not pattern:
+            raise ValueError("Pattern [{}] is already registered for [{}]".format(name, path))
+        if name in patterns:
+            return
+
+        patterns[name] = pattern
+        if path in self.results:
+            # File was already scanned - rescan to collect matches of the new pattern
+            del self.results[path]
+
+    def get(self, path, name):
+        # Returns: List of (line number, match) for pattern in file (LIST)
+        if path not in self.results:
+            self.scan(path)
+        return self.results[path].get(name, [])
+
+    def forget(self, path):
+        # Drops matches of changed file, it is rescanned on next request
+        self.results.pop(path, None)
+
+    def scan(self, path):
+        patterns = list(self.plan.get(path, {}).items())
+        matches = {name: [] for name, _ in patterns}
+
+        text = self.files.read_text(path)
+        if self.strip_comments:
+            text = self.tokenizer.strip_comments(text)
+
+        for line_no, line in enumerate(text.splitlines(), 1):
+            for name, pattern in patterns:
+                r = pattern.search(line)
+                if r:
+                    matches[name].append((line_no, r))
+
+        self.results[path] = matches
 
 
 
@@ -229,13 +1628,15 @@ class tSFSettings:
 
     SHORTCUT = "_tsf_"
 
-    def __init__(self, config, target_dir):
+    def __init__(self, config, files, scanner=None):
         self.cfg = config
         self.section = "tSF_config"
         self.modulesPath = self.get("path")
+        self.files = files
+        self.scanner = scanner or PatternScanner(files)
 
-        pattern = self.get_re("pattern")
-        filepath = os.path.join(target_dir, self.get("config"))
+        pattern = self.get_pattern("pattern")
+        filepath = files.get_path(self.get("config"))
         self.modules = self.read_tsf_settings(filepath, pattern)
 
     def get(self, key):
@@ -244,10 +1645,13 @@ class tSFSettings:
     def get_re(self, key):
         return self.cfg.get_regexp((self.section, key))
 
+    def get_pattern(self, key):
+        return self.cfg.get_pattern((self.section, key))
+
     def get_module_from_path(self, path):
         # Extract module name from given piece of path in format "_tSF_\IntroText\Settings.sqf"
-        path = self.strip_shortcut(path)
-        return os.path.split(path)[0]
+        path = normalize_path(self.strip_shortcut(path))
+        return path.rpartition("/")[0]
 
     def is_module_active(self, module_name):
         # Returns: True if tSf module is activated in tSF init
@@ -257,14 +1661,12 @@ class tSFSettings:
         # Parse given file and compose dict of module settings
         # Returns: Dict of modules state (BOOLS) or {} if file not found
         settings = {}
-        if not os.path.isfile(file):
+        if not file:
             return settings
 
-        with open(file, "r") as tSFFile:
-            for line in tSFFile:
-                r = re.search(pattern, line, re.I)
-                if r:
-                    settings[r[1].lower()] = r[2].lower() == 'true'
+        self.scanner.add(file, "modules", pattern)
+        for _, r in self.scanner.get(file, "modules"):
+            settings[r[1].lower()] = r[2].lower() == 'true'
 
         return settings
 
@@ -281,37 +1683,54 @@ class tSFSettings:
         if self.check_is_shortcut(filename):
             filename = self.strip_shortcut(filename)
 
-        return os.path.join(self.modulesPath, filename)
+        return normalize_path(self.modulesPath) + "/" + normalize_path(filename)
 
 
 
 
 class GearSettings:
-    def __init__(self, config, target_dir):
+    # Mission files indexed for kit definitions and references
+    KIT_FILE_EXTENSIONS = (".sqf", ".hpp", ".ext")
+
+    def __init__(self, config, files, scanner=None):
         self.cfg = config
         self.section = "dzn_Gear"
-        self.tgt_dir = target_dir
+        self.files = files
+        self.scanner = scanner or PatternScanner(files, True)
+        self.kit_index = None
 
-        filepath = os.path.join(target_dir, self.get("kits_file"))
-        pattern = self.get_re("kitname_pattern")
+        filepath = files.get_path(self.get("kits_file"))
+        pattern = self.get_pattern("kitname_pattern")
         self.kits = self.read_kits(filepath, pattern)
 
     def read_kits(self, file, pattern):
-        # Returns: Set of kitnames (STRINGs) or {} if file not found
-        kits = set()
-        if not os.path.isfile(file):
-            return kits
-
-        with open(file, 'r') as f:
-            for line in f:
-                r = re.search(pattern, line, re.I)
-                if r:
-                    kits.add(r[0].lower())
-
-        print("Found {} kits:".format(len(kits)))
-        print(kits)
-
-        return kits
+        # Indexes kits defined and referenced in Kits.sqf and all other SQF/config files of the mission in one pass,
+        # so kits defined in included files are known and every reference to kit may be looked up by index.
+        # Returns: Set of kitnames (STRINGs) defined in mission, skipping commented out kits, or {} if file not found
+        self.kit_index = KitIndex(pattern)
+        if not file:
+            return set()
+
+        kits_key = self.files.get_key(file)
+        paths = [(kits_key, file)] + [
+            (key, path) for key, path, _ in self.files.list_files()
+            if key.lower().endswith(self.KIT_FILE_EXTENSIONS) and key != kits_key
+        ]
+        for key, path in paths:
+            self.kit_index.add_file(self.files.read_text(path), key)
+
+        return set(self.kit_index.definitions)
+
+    def update_kits(self, paths):
+        # Re-indexes changed SQF/config files only, removed files (with empty path) are dropped from index
+        for key, path in paths.items():
+            if not key.lower().endswith(self.KIT_FILE_EXTENSIONS):
+                continue
+            if path:
+                self.kit_index.add_file(self.files.read_text(path), key)
+            else:
+                self.kit_index.remove_file(key)
+        self.kits = set(self.kit_index.definitions)
 
     def get(self, key):
         return self.cfg.get((self.section, key))
@@ -319,6 +1738,15 @@ class GearSettings:
     def get_re(self, key):
         return self.cfg.get_regexp((self.section, key))
 
+    def get_pattern(self, key):
+        return self.cfg.get_pattern((self.section, key))
+
+    def get_kit_pattern(self, pattern):
+        # Returns: Compiled checklist pattern or default kitname pattern, if none given (Pattern)
+        if not pattern:
+            return self.get_pattern("kitname_pattern")
+        return self.cfg.compile_re(pattern)
+
     def get_gat(self):
         # Getter for GAT file path
         return self.get("gat_file")
@@ -332,103 +1760,700 @@ class GearSettings:
         # Return True if exists
         return kitname.lower() in self.kits
 
-    def get_gat_kits(self, file):
-        # Return list of kits mentioned in GAT
-        kits = set()
-        pattern = self.get_re("gat_table_pattern")
-        with open(file, 'r') as f:
-            for line in f:
-                r = re.search(pattern, line, re.I)
-                if r:
-                    name = r[2].lower()
-                    if name[0] != "@":
-                        kits.add(r[2].lower())
+    def get_missing_kit_note(self, kitname):
+        # Returns: Explanation for missing kit, if it is commented out in Kits.sqf (STRING)
+        line = self.kit_index.get_commented_line(kitname)
+        if line is None:
+            return ""
+        return " (commented out at line {})".format(line)
 
+    def get_kits_digest(self):
+        # Returns: Hash of kits defined in mission (STRING)
+        return self.kit_index.get_digest()
+
+    def get_gat_kits(self, file):
+        # Returns: Kits referenced in GAT with line of their first reference, in order of appearance (DICT)
+        kits = {}
+        for name, line in self.kit_index.get_file_references(self.files.get_key(file)):
+            kits.setdefault(name, line)
         return kits
 
+    def plan_kit_check(self, file, pattern):
+        # Registers custom checklist pattern for file, so all patterns of the file are matched in one pass.
+        # Default kitname pattern is not scanned - its matches are taken from kit index.
+        # Returns: Name of registered pattern or empty string (STRING)
+        if not pattern:
+            return ""
+        compiled = self.get_kit_pattern(pattern)
+        self.scanner.add(file, compiled.pattern, compiled)
+        return compiled.pattern
+
+    def get_pattern_kits(self, file, pattern):
+        # Returns: List of (line number, kitname) matched by custom pattern in file (LIST)
+        name = self.plan_kit_check(file, pattern)
+        return [(line_no, r[1].lower()) for line_no, r in self.scanner.get(file, name) if r[1]]
+
     def check_kit_in_file(self, file, pattern):
-        # Open file
-        # Find pattern match
-        # Check kit exists
-        # Return dict in form of: {"kitname": STRING, "isValid": BOOL}
+        # Find kits in file (by index or by custom pattern) and check kits exist
+        # Return list of dicts in form of: {"name": STRING, "valid": BOOL, "line": INT}
+        if pattern:
+            found = self.get_pattern_kits(file, pattern)
+        else:
+            found = [(line_no, name) for name, line_no in self.kit_index.get_file_references(self.files.get_key(file))]
 
-        kits_found = list()
-        if not pattern:
-            pattern = self.get_re("kitname_pattern")
+        return [{"name": name, "valid": self.check_kit_exists(name), "line": line_no} for line_no, name in found]
+
+    def get_kit_report(self, pattern_files=()):
+        # Collects kits used in custom pattern matches of given (path, pattern) pairs into index and
+        # reports unknown and unused kits of the whole mission at once
+        # Returns: Unknown kits with their references (DICT) and unused kits (LIST)
+        for path, pattern in pattern_files:
+            key = self.files.get_key(path)
+            for line_no, name in self.get_pattern_kits(path, pattern):
+                if not any(ref[:2] == (key, line_no) for ref in self.kit_index.references.get(name, [])):
+                    self.kit_index.add_reference(name, key, line_no)
+
+        return self.kit_index.get_unknown(), self.kit_index.get_unused()
+
+
+
+
+
+
+class ReviewCache:
+    """
+        Stores results of the last review of each repo: commit SHA, content hashes of reviewed files
+        and findings of every check, keyed by check input signature
+    """
+
+    VERSION = 2
+
+    def __init__(self, cache_dir, repo, commit, config_hash):
+        self.file = os.path.join(cache_dir, hashlib.sha1(repo.encode("utf-8")).hexdigest() + ".json")
+        self.previous = self.load(config_hash)
+        self.current = self.create_review(repo, commit, config_hash)
+
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+        except OSError:
+            pass
+
+    def create_review(self, repo, commit, config_hash):
+        # Returns: Empty review results (DICT)
+        return {
+            "version": self.VERSION, "repo": repo, "commit": commit, "config": config_hash,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"), "files": {}, "stamps": {}, "checks": {}, "review": []
+        }
+
+    def advance(self):
+        # Makes current review the previous one, so re-review of the same files reuses its results (watch mode)
+        current = self.current
+        self.previous = current
+        self.current = self.create_review(current["repo"], current["commit"], current["config"])
+
+    def load(self, config_hash):
+        # Returns: Previous review of the repo or empty dict, if none or it was made with another config (DICT)
+        try:
+            with open(self.file, "r") as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        if previous.get("version") != self.VERSION or previous.get("config") != config_hash:
+            return {}
+        return previous
+
+    def get_known_hashes(self, files):
+        # Files of the same commit are not changed, so their hashes from previous review may be trusted.
+        # Without commit, hash is trusted while file stamp (size and mtime, or archive CRC) is the same.
+        # Returns: Dict of file paths to hashes (DICT)
+        commit = self.current["commit"]
+        known = self.previous.get("files", {})
+        if commit and self.previous.get("commit") == commit:
+            return known
+
+        stamps = self.previous.get("stamps", {})
+        trusted = {}
+        for key, file_hash in known.items():
+            path = files.get_path(key) if key in stamps else ""
+            if path and files.get_stamp(path) == stamps[key]:
+                trusted[key] = file_hash
+        return trusted
+
+    def get(self, check_id, signature):
+        # Returns: Previous result of check or None, if check inputs have changed (DICT)
+        result = self.previous.get("checks", {}).get(check_id)
+        if result and result.get("signature") == signature:
+            return result
+        return None
+
+    def put(self, check_id, signature, findings, copies):
+        self.current["checks"][check_id] = {"signature": signature, "findings": findings, "copies": copies}
+
+    def save(self, files, review, stamps):
+        self.current["files"] = files
+        self.current["stamps"] = stamps
+        self.current["review"] = review
+        tmp_name = get_tmp_name(self.file)
+        try:
+            with open(tmp_name, "w") as f:
+                json.dump(self.current, f)
+            os.replace(tmp_name, self.file)
+        except OSError:
+            pass
+
+    def get_delta(self, review):
+        # Returns: Findings appeared and gone since previous review (TUPLE of LISTs)
+        if not self.previous:
+            return None, None
+
+        before = Counter(self.previous.get("review", []))
+        after = Counter(review)
+        return list((after - before).elements()), list((before - after).elements())
+
+
+
+
+class ReviewWriter:
+    """
+        Writes review artifacts (edited mission files) to review directory or, as bundle, to single zip archive.
+        Review is written under temporary name and replaces the previous one on commit (directory is swapped by
+        renames, archive by single replace), so readers and concurrent reviews never see half-written review.
+        Files of mission directory are reflinked or hardlinked where filesystem allows it, copied otherwise;
+        archive members are streamed into bundle without intermediate files.
+        Committed review may be reopened to be updated in place: changed files are replaced and removed ones deleted
+        (bundle is rewritten, members which were not replaced are taken from the previous bundle).
+    """
+
+    def __init__(self, path, bundle=False):
+        self.path = path + ".zip" if bundle else path
+        self.tmp_path = get_tmp_name(self.path)
+        self.names = set()
+        self.removed = set()
+        self.bundle = None
+        self.in_place = False
+        self.closed = False
+
+        if bundle:
+            self.bundle = ZipFile(self.tmp_path, "w", ZIP_DEFLATED)
         else:
-            pattern = strip_re(pattern)
+            if os.path.isdir(self.tmp_path):
+                shutil.rmtree(self.tmp_path)
+            os.makedirs(self.tmp_path)
 
-        print("> Pattern: " + pattern)
+    def add(self, files, path, name):
+        # Adds mission file to review under given name, file added before is kept
+        if name in self.names:
+            return
+        self.names.add(name)
 
-        with open(file,'r') as f:
-            for line in f:
-                r = re.search(pattern, line, re.I)
-                if r:
-                    print("Something found")
-                    print(r)
+        if self.bundle:
+            with self.bundle.open(name, "w") as dst:
+                files.write_to(path, dst)
+        else:
+            # File of review updated in place may be a hardlink of mission file, it must not be written through
+            destination = os.path.join(self.tmp_path, name)
+            if self.in_place:
+                with contextlib.suppress(OSError):
+                    os.remove(destination)
+            files.copy(path, destination)
+
+    def add_text(self, name, text):
+        # Adds text file (e.g. diff of edited file) to review
+        if name in self.names:
+            return
+        self.names.add(name)
 
-                    name = r[1].lower()
-                    if not name:
-                        continue
-                    is_valid = self.check_kit_exists(name)
-                    kits_found.append({"name": name, "valid": is_valid})
+        if self.bundle:
+            self.bundle.writestr(name, text)
+        else:
+            destination = os.path.join(self.tmp_path, name)
+            if self.in_place:
+                with contextlib.suppress(OSError):
+                    os.remove(destination)
+            with open(destination, "w", encoding="utf-8") as f:
+                f.write(text)
+
+    def remove(self, name):
+        # Removes file from review being updated in place
+        self.removed.add(name)
+        if not self.bundle:
+            with contextlib.suppress(OSError):
+                os.remove(os.path.join(self.tmp_path, name))
+
+    def reopen(self):
+        # Starts in place update of committed review
+        self.names = set()
+        self.removed = set()
+        self.in_place = True
+        self.closed = False
+        if self.bundle:
+            self.bundle = ZipFile(self.tmp_path, "w", ZIP_DEFLATED)
+        else:
+            self.tmp_path = self.path
+            os.makedirs(self.path, exist_ok=True)
 
-        return kits_found
+    def commit(self):
+        # Replaces previous review with the written one
+        if self.closed:
+            return
+        self.closed = True
 
+        if self.bundle:
+            if self.in_place and os.path.isfile(self.path):
+                self.copy_kept_members()
+            self.bundle.close()
+            os.replace(self.tmp_path, self.path)
+            return
+        if self.in_place:
+            return
+
+        old_path = None
+        if os.path.isdir(self.path):
+            old_path = get_tmp_name(self.path + ".old")
+            os.rename(self.path, old_path)
+        os.rename(self.tmp_path, self.path)
+        if old_path:
+            shutil.rmtree(old_path, ignore_errors=True)
+
+    def copy_kept_members(self):
+        # Copies members of previous bundle, which were neither replaced nor removed, to the new one
+        with ZipFile(self.path, "r") as previous:
+            for info in previous.infolist():
+                if info.filename not in self.names and info.filename not in self.removed:
+                    with previous.open(info) as src, self.bundle.open(info.filename, "w") as dst:
+                        shutil.copyfileobj(src, dst)
+
+    def abort(self):
+        # Drops written review, keeping the previous one (review updated in place keeps files written so far)
+        if self.closed:
+            return
+        self.closed = True
+        if self.in_place and not self.bundle:
+            return
 
+        if self.bundle:
+            self.bundle.close()
+            with contextlib.suppress(OSError):
+                os.remove(self.tmp_path)
+        else:
+            shutil.rmtree(self.tmp_path, ignore_errors=True)
 
 
 
 
 class Reviewer:
     USE_TEST_MISSION = False
-
-    def __init__(self):
-        self.reporter = Reporter()
-        self.comparator = Comparator()
+    REVIEW_LISTS = ["Core", "Dynai", "Gear", "tSF", "tSF_modules"]
+
+    def __init__(self, mission="", output_dir="", quiet=False, metrics="", context=None, tree=False):
+        # mission - GitHub URL or path to review without prompting, output_dir - directory for logs, review and downloads
+        # metrics - format of stage timings export (jsonl or prom), no metrics are collected if empty
+        # context - warm config and reference index of review service (ReviewContext), read from disk if not given
+        # tree - compare whole mission tree with reference, not only checklist files
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+        self.mission = mission
+        self.output_dir = output_dir
+        self.context = context
+        self.tree = tree
+        self.metrics = Metrics(metrics) if metrics else NO_METRICS
+        self.reporter = Reporter(output_dir, quiet)
+        self.comparator = Comparator(metrics=self.metrics)
 
         self.configName = "config.yaml"
         self.cfg = None
+        self.config_hash = ""
         self.target_dir = None
+        self.target_files = None
+        self.archive = None
         self.review_dir = None
+        self.review_writer = None
         self.ref_dir = None
+        self.ref_files = None
         self.tSF = None
         self.Gear = None
-
+        self.scanner = None
+        self.cache = None
+        self.file_cache = None
+        self.file_hashes = {}
+        self.known_hashes = {}
+        self.copies = None
+        # Review directory names of copied files to their input keys, copies kept from previous run (watch mode)
+        self.copied = {}
+        self.kept_copies = set()
+        self.reused_checks = 0
+        self.run_checks = []
+        self.delta = ([], [])
+
+    @timed("Reviewer.prepare")
     def prepare(self):
         # Read config, validate target and reference directories
         self.reporter.info("---------- App Started ----------")
         self.reporter.info("Initializiation")
 
-        self.cfg = self.read_config(self.configName)
+        references = None
+        if self.context:
+            self.cfg, self.config_hash, references = self.context.refresh()
+        else:
+            self.cfg = self.read_config(self.configName)
+        self.reporter.set_flush_policy(*self.get_flush_policy())
         self.reporter.setup(self.cfg.get("Reporter"))
         self.reporter.info("Config read successfully")
 
         self.ref_dir = self.cfg.get("reference_path")
         if not self.ref_dir or not os.path.isdir(self.ref_dir):
             self.fatal_and_exit("Error: Could not find reference directory!")
+        if references is None:
+            references = ReferenceVersions.from_config(self.cfg)
+        self.reporter.info("Reference index is ready ({} versions)".format(len(references.indexes)))
 
         if Reviewer.USE_TEST_MISSION:
-            self.target_dir = self.cfg.get("test_path")
+            self.target_files = MissionFiles(self.cfg.get("test_path"))
         else:
-            self.target_dir = self.get_mission_dir()
+            self.target_files = self.get_mission_dir()
+        self.target_files.metrics = self.metrics
+        self.target_files.cache = self.file_cache = self.get_file_cache()
+        self.target_dir = self.target_files.root
+
+        self.setup_cache()
+        self.select_reference(references)
 
-        self.review_dir = self.create_review_dir(self.cfg.get("review_directory_name"))
+        self.review_dir = self.create_review_dir(os.path.join(self.output_dir, self.cfg.get("review_directory_name")))
 
         self.reporter.info("| Reference | " + self.ref_dir)
         self.reporter.info("| Revivewed | " + self.target_dir)
         self.reporter.info("| Review to | " + self.review_dir)
 
-        self.tSF = tSFSettings(self.cfg, self.target_dir)
+        self.scanner = PatternScanner(self.target_files, strip_comments=True)
+        self.tSF = tSFSettings(self.cfg, self.target_files, self.scanner)
         if not self.tSF.modules:
             self.fatal_and_exit("Error: Could not find valid dzn_tSFramework_Init.sqf in reviewed mission!")
 
-        self.Gear = GearSettings(self.cfg, self.target_dir)
+        self.Gear = GearSettings(self.cfg, self.target_files, self.scanner)
         if not self.Gear.kits:
             self.reporter.warn("Error: Could not find any dzn_Gear kit!")
+        else:
+            self.reporter.info("Found {} kits: {}".format(len(self.Gear.kits), ", ".join(sorted(self.Gear.kits))))
 
         self.reporter.info("Initialized")
 
+    def select_reference(self, references):
+        # Uses reference version closest to reviewed mission, when several versions are registered
+        # Returns: Name of selected version (STRING)
+        name = references.default
+        if len(references.indexes) > 1:
+            scores = references.match(self.get_fingerprint(references.sizes))
+            name = scores[0][0]
+            self.reporter.info("Reference version [{}] is the closest one (similarity {:.2f}), others: {}".format(
+                name, scores[0][1], ", ".join("{} {:.2f}".format(*score) for score in scores[1:])
+            ))
+
+        index = references.get(name)
+        self.ref_dir = index.root
+        self.ref_files = MissionFiles(self.ref_dir, self.metrics, self.file_cache, index.paths)
+        self.comparator = Comparator(index, self.metrics)
+        return name
+
+    def get_fingerprint(self, sizes):
+        # Fingerprints mission framework files (files known to any reference version) as (path, hash) set.
+        # File of size unknown to every version can't match any of them, so it is not read.
+        # Returns: Set of (lowercase path, hash) (SET)
+        fingerprint = set()
+        pending = {}
+        for key, known_sizes in sizes.items():
+            path = self.target_files.get_path(key)
+            if not path:
+                continue
+            size = self.target_files.size(path)
+            if size not in known_sizes:
+                fingerprint.add((key.lower(), "size:{}".format(size)))
+            elif key in self.file_hashes or key in self.known_hashes:
+                fingerprint.add((key.lower(), self.file_hashes.setdefault(key, self.known_hashes.get(key))))
+            else:
+                pending[path] = key
+
+        for path, file_hash in hash_files(self.target_files.hash, list(pending)).items():
+            self.file_hashes[pending[path]] = file_hash
+            fingerprint.add((pending[path].lower(), file_hash))
+        return fingerprint
+
+    def get_archive_cache(self):
+        # Returns: Archive cache configured in config or None (ArchiveCache)
+        try:
+            cache_dir = self.cfg.get("archive_cache")
+            max_size = int(self.cfg.get("archive_cache_size")) * 1024 * 1024
+        except ValueError:
+            return None
+        return ArchiveCache(os.path.expanduser(cache_dir), max_size)
+
+    def get_flush_policy(self):
+        # Returns: Lines and seconds after which logs are flushed, as configured (TUPLE)
+        try:
+            return int(self.cfg.get("log_flush_lines")), float(self.cfg.get("log_flush_interval"))
+        except ValueError:
+            return 100, 1.0
+
+    def get_file_cache(self):
+        # Returns: Cache of files read during this review, limited by configured size (FileCache)
+        try:
+            return FileCache(int(self.cfg.get("file_cache_size")) * 1024 * 1024)
+        except ValueError:
+            return FileCache()
+
+    def setup_cache(self):
+        # Loads previous review of the same repo, to reuse results of checks which inputs were not changed
+        repo = self.mission if self.mission.startswith("http") else os.path.abspath(self.target_dir)
+        if not self.config_hash:
+            with open(self.configName, "rb") as f:
+                self.config_hash = hash_stream(f)
+
+        self.cache = ReviewCache(
+            self.cfg.get("review_cache"), repo.rstrip("/").lower(), self.target_files.commit, self.config_hash
+        )
+        self.known_hashes = self.cache.get_known_hashes(self.target_files)
+        if self.known_hashes and self.target_files.commit:
+            self.reporter.info("Commit {} was reviewed before".format(self.target_files.commit))
+
+    def run(self):
+        # Runs full review: all checklists and gear validation
+        self.prepare()
+        self.review_all()
+        self.finish()
+
+    def review_all(self):
+        # Runs all checklists, gear validation and mission tree comparison, if enabled
+        for list_name in self.REVIEW_LISTS:
+            self.review(list_name)
+        self.review_gear()
+        self.review_kits()
+        if self.tree:
+            self.review_tree()
+
+    def update(self, changed):
+        # Reviews mission again after given files were changed (watch mode). Mission files, kit index and hashes of
+        # not changed files are kept: changed files are re-read and re-indexed only, checks which inputs were not
+        # changed replay their previous findings. Review directory is updated in place.
+        paths = self.target_files.update_paths(changed)
+        keys = {key.lower() for key in paths}
+        for hashes in (self.file_hashes, self.known_hashes):
+            for key in [key for key in hashes if self.get_input_key(key) in keys]:
+                del hashes[key]
+        for path in paths.values():
+            self.scanner.forget(path)
+
+        tsf_init = self.tSF.get("config")
+        if self.get_input_key(tsf_init) in keys:
+            self.tSF.modules = self.tSF.read_tsf_settings(
+                self.target_files.get_path(tsf_init), self.tSF.get_pattern("pattern")
+            )
+
+        kits_file = self.Gear.get("kits_file")
+        indexed = {file.lower() for file in self.Gear.kit_index.files}
+        if self.get_input_key(kits_file) in keys and (
+            self.get_input_key(kits_file) not in indexed or not self.target_files.get_path(kits_file)
+        ):
+            # Kits file was created or removed, whole mission is indexed again
+            self.Gear = GearSettings(self.cfg, self.target_files, self.scanner)
+        else:
+            self.Gear.update_kits(paths)
+
+        self.run_checks = []
+        self.reused_checks = 0
+        self.delta = ([], [])
+        previous_copies, self.copied = self.copied, {}
+        self.kept_copies = {name for name, key in previous_copies.items() if key not in keys}
+        self.reporter.reset()
+        self.reporter.info("Files changed: {}".format(", ".join(sorted(paths))))
+        if not self.tSF.modules:
+            self.reporter.warn("Error: Could not find valid dzn_tSFramework_Init.sqf in reviewed mission!")
+        self.cache.advance()
+        self.review_writer.reopen()
+
+        self.review_all()
+        for name in set(previous_copies) - set(self.copied):
+            self.review_writer.remove(name)
+            self.review_writer.remove(name + ".diff")
+        self.finish()
+
+    def get_input_key(self, filename):
+        # Returns: Normalized lowercase mission path of check input, with tSF shortcut resolved (STRING)
+        if self.tSF.check_is_shortcut(filename):
+            filename = self.tSF.get_file(filename)
+        return normalize_path(filename).lower()
+
+    def finish(self):
+        # Exports metrics, saves review results to cache and writes delta against previous review
+        if self.metrics.enabled:
+            self.reporter.info("Metrics exported to {}".format(self.metrics.export(self.output_dir)))
+        self.write_findings()
+        self.reporter.set_msg_prefix("")
+        try:
+            self.review_writer.commit()
+        except OSError:
+            self.reporter.error("Failed to write review directory!")
+        if self.file_cache:
+            self.reporter.info("Files read: {}, served from file cache: {}".format(
+                self.file_cache.reads, self.file_cache.hits
+            ))
+
+        if not self.cache:
+            return
+
+        self.reporter.info("Checks reused from previous review: {}".format(self.reused_checks))
+        stamps = {}
+        for key, file_hash in self.file_hashes.items():
+            path = self.target_files.get_path(key) if file_hash else ""
+            if path:
+                stamps[key] = self.target_files.get_stamp(path)
+        self.cache.save(self.file_hashes, self.reporter.findings, stamps)
+
+        added, removed = self.cache.get_delta(self.reporter.findings)
+        if added is not None:
+            self.delta = (added, removed)
+        lines = ["-------- Review delta ------"]
+        if added is None:
+            lines.append("No previous review found.")
+        else:
+            lines.append("Previous review: {} (commit {})".format(
+                self.cache.previous.get("time"), self.cache.previous.get("commit") or "unknown"
+            ))
+            lines.extend("+ " + line for line in added)
+            lines.extend("- " + line for line in removed)
+            lines.append("New findings: {}, resolved findings: {}".format(len(added), len(removed)))
+
+        try:
+            with open(os.path.join(self.output_dir, "Review.delta.log"), "w") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError:
+            self.reporter.error("Failed to write review delta!")
+
+    def write_findings(self):
+        # Writes structured findings as Review.json and Review.sarif, each file in single write
+        for record in self.reporter.records:
+            record["file"] = self.get_finding_file(record["file"])
+            record["module"] = self.get_module(record["file"])
+
+        report = {
+            "mission": self.mission,
+            "commit": self.target_files.commit if self.target_files else "",
+            "counters": dict(self.reporter.counters),
+            "findings": self.reporter.records
+        }
+        for filename, data in (("Review.json", report), ("Review.sarif", self.get_sarif())):
+            try:
+                with open(os.path.join(self.output_dir, filename), "w") as f:
+                    f.write(json.dumps(data, indent=1))
+            except OSError:
+                self.reporter.error("Failed to write {}!".format(filename))
+
+    def get_sarif(self):
+        # Returns: Findings in SARIF 2.1.0 format (DICT)
+        rules = {}
+        results = []
+        for record in self.reporter.records:
+            rules.setdefault(record["code"], self.reporter.config.get(record["code"]))
+            result = {
+                "ruleId": record["code"],
+                "level": record["severity"],
+                "message": {"text": record["message"]},
+                "properties": {"kit": record["kit"], "module": record["module"]}
+            }
+            if record["file"]:
+                location = {"artifactLocation": {"uri": record["file"]}}
+                if record["line"]:
+                    location["region"] = {"startLine": record["line"]}
+                result["locations"] = [{"physicalLocation": location}]
+            results.append(result)
+
+        return {
+            "$schema": "https://json.schemastore.org/sarif-2.1.0.json",
+            "version": "2.1.0",
+            "runs": [{
+                "tool": {"driver": {
+                    "name": "tSF Review Helper",
+                    "version": "0.2",
+                    "rules": [{"id": code, "shortDescription": {"text": text}} for code, text in sorted(rules.items())]
+                }},
+                "properties": {"mission": self.mission},
+                "results": results
+            }]
+        }
+
+    def get_finding_file(self, filename):
+        # Resolves Checklist path (which may use tSF shortcut or other letter case) to path in mission
+        # Returns: Normalized path relative to mission root (STRING)
+        if not filename or not self.tSF or not self.target_files:
+            return filename
+        path = self.get_file_path(self.target_files, filename)
+        if path:
+            return self.target_files.get_key(path)
+        if self.tSF.check_is_shortcut(filename):
+            return normalize_path(self.tSF.get_file(filename))
+        return filename
+
+    def get_module(self, filename):
+        # Returns: tSF module name for tSF module files, top directory for other nested files or empty string (STRING)
+        if not filename:
+            return ""
+        if self.tSF and self.tSF.check_is_shortcut(filename):
+            return self.tSF.get_module_from_path(filename)
+
+        parts = normalize_path(filename).split("/")
+        modules_path = normalize_path(self.tSF.modulesPath).split("/") if self.tSF else []
+        if modules_path and len(parts) > len(modules_path) + 1 and parts[:len(modules_path)] == modules_path:
+            return parts[len(modules_path)]
+        return parts[0] if len(parts) > 1 else ""
+
+    def get_file_hash(self, filename):
+        # Returns: Content hash of mission file or empty string, if file not exists (STRING)
+        key = normalize_path(filename)
+        if key not in self.file_hashes:
+            path = self.get_file_path(self.target_files, filename)
+            if key in self.known_hashes:
+                self.file_hashes[key] = self.known_hashes[key] if path else ""
+            else:
+                self.file_hashes[key] = self.target_files.hash(path) if path else ""
+        return self.file_hashes[key]
+
+    def get_signature(self, filenames, *extra):
+        # Returns: Signature of check inputs - mission files content, reference files content and extra values (STRING)
+        parts = [self.get_file_hash(filename) for filename in filenames]
+        for filename in filenames:
+            ref_path = self.get_file_path(self.ref_files, filename)
+            ref_entry = self.comparator.index.get(ref_path) if ref_path and self.comparator.index else None
+            parts.append(ref_entry[1] if ref_entry else "")
+        parts.extend(str(value) for value in extra)
+        return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+    def run_check(self, check_id, signature, check):
+        # Runs check, or replays its findings and file copies from previous review, if its inputs are the same
+        previous = self.cache.get(check_id, signature) if self.cache else None
+        if previous:
+            self.reporter.info("Inputs are not changed, reusing previous result of [{}]".format(check_id))
+            self.reused_checks += 1
+            self.reporter.replay(previous["findings"])
+            for filename in previous["copies"]:
+                path = self.get_file_path(self.target_files, filename)
+                if path:
+                    self.copy_reviewed_file(self.target_files, path, filename)
+            if self.cache:
+                self.cache.put(check_id, signature, previous["findings"], previous["copies"])
+            return
+
+        self.reporter.start_capture()
+        self.copies = []
+        self.run_checks.append(check_id)
+        try:
+            check()
+        finally:
+            findings = self.reporter.stop_capture()
+            copies, self.copies = self.copies, None
+        if self.cache:
+            self.cache.put(check_id, signature, findings, copies)
+
+    @timed("Reviewer.review", 0)
     def review(self, list_name):
         # Validates files from Checklist
         self.reporter.set_msg_prefix("(Review)")
@@ -438,61 +2463,74 @@ class Reviewer:
 
         for fileInfo in checklist:
             filename = fileInfo.get("file", "")
-            alert_identical = fileInfo.get("alert", False)
-
             self.reporter.info("Reviewing file {}".format(filename))
 
             module_active = False
             if is_tsf_modules:
-                # Ensures that not changed files in inactive modules won't be reported
                 module = self.tSF.get_module_from_path(filename)
                 module_active = self.tSF.is_module_active(module)
-                alert_identical = alert_identical and module_active
 
-            path = self.get_changed_file(filename, alert_identical)
-            if not path:
-                continue
+            self.run_check(
+                "{}:{}".format(list_name, filename),
+                self.get_signature([filename], module_active),
+                lambda: self.review_file(fileInfo, is_tsf_modules, module_active)
+            )
 
-            if is_tsf_modules:
-                if not module_active:
-                    self.reporter.review_error(3, filename)
-                    continue
+        self.reporter.info("{} reviewed".format(list_name))
 
-            self.copy_reviewed_file(path, filename, self.review_dir)
-            self.reporter.review_info(2, filename)
+    def review_file(self, fileInfo, is_tsf_modules, module_active):
+        # Compares checklist file with reference and copies edited file to review directory
+        filename = fileInfo.get("file", "")
+        alert_identical = fileInfo.get("alert", False)
 
-        self.reporter.info("{} reviewed".format(list_name))
+        if is_tsf_modules:
+            # Ensures that not changed files in inactive modules won't be reported
+            alert_identical = alert_identical and module_active
+
+        path = self.get_changed_file(filename, alert_identical)
+        if not path:
+            return
 
+        if is_tsf_modules:
+            if not module_active:
+                self.reporter.review_error(3, filename)
+                return
+
+        self.copy_reviewed_file(self.target_files, path, filename)
+        self.reporter.review_info(2, filename)
+
+    @timed("Reviewer.review_gear")
     def review_gear(self):
         # Get GAT and validate kits
         self.reporter.set_msg_prefix("(Gear)(GAT)")
         self.reporter.info("Validating GAT kits")
 
-        dir_path = self.target_dir
+        files = self.target_files
 
-        gat = self.get_file_path(dir_path, self.Gear.get_gat())
+        gat = self.get_file_path(files, self.Gear.get_gat())
         if not gat:
             self.reporter.error("No Gear Assignment Table file found!")
             self.reporter.review_error(4)
             return
 
-        gat_kits = self.Gear.get_gat_kits(gat)
-        if not gat_kits:
-            self.reporter.error("Failed to find kits in Gear Assignment Table!")
-            self.reporter.review_error(5)
-        else:
-            self.reporter.info("There are {} kits in GAT file.".format(len(gat_kits)))
-            for kit in gat_kits:
-                if self.Gear.check_kit_exists(kit):
-                    self.reporter.info("    Kit {} exists.".format(kit))
-                else:
-                    self.reporter.error("   Kit {} is missing!".format(kit))
-                    self.reporter.review_error(6, kit)
+        kits_digest = self.Gear.get_kits_digest()
+        self.run_check(
+            "Gear:GAT",
+            self.get_signature([self.Gear.get_gat()], kits_digest),
+            lambda: self.review_gat(gat)
+        )
         self.reporter.info("GAT validated")
 
         # Get files and check for kits
         self.reporter.set_msg_prefix("(Gear)(Checklist)")
         checklist = self.Gear.get_checklist()
+
+        # Register all checklist patterns first, so each file is scanned once for all of its patterns
+        for fileInfo in checklist:
+            path = self.get_file_path(files, fileInfo.get("file", ""))
+            if path:
+                self.Gear.plan_kit_check(path, fileInfo.get("pattern", ""))
+
         for fileInfo in checklist:
             file = fileInfo.get("file", "")
             pattern = fileInfo.get("pattern", "")
@@ -504,55 +2542,201 @@ class Reviewer:
                     self.reporter.info("Skipping checks for inactive module [{}]".format(module))
                     continue
 
-            file = self.get_file_path(dir_path, file)
+            path = self.get_file_path(files, file)
 
-            if not os.path.isfile(file):
+            if not path:
                 self.reporter.error("Skip [{}] - file not found. ".format(file))
                 continue
 
-            kits_found = self.Gear.check_kit_in_file(file, pattern)
-            if not kits_found:
-                self.reporter.error("Failed to find kits in [{}] file!".format(file))
-                self.reporter.review_error(8, file)
-            else:
-                for kitInfo in kits_found:
-                    kit_name = kitInfo.get("name")
-                    if kitInfo.get("valid"):
-                        self.reporter.info("    Kit [{}] exists".format(kit_name))
-                    else:
-                        self.reporter.error("   Kit [{}] is missing in Kits.sqf".format(kit_name))
-                        self.reporter.review_error(7, kit_name, file)
+            self.run_check(
+                "Gear:{}:{}".format(file, pattern),
+                self.get_signature([file], kits_digest),
+                lambda: self.review_gear_file(path, pattern)
+            )
 
             self.reporter.info("Finished")
 
+    @timed("Reviewer.review_kits")
+    def review_kits(self):
+        # Reports kits referenced anywhere in mission, but not defined, and kits defined, but never used - both from
+        # kit index. Undefined kits of GAT and Checklist files are already reported by their checks.
+        self.reporter.set_msg_prefix("(Gear)(Kits)")
+        self.reporter.info("Validating kit references in mission")
+        files = self.target_files
+
+        checked = set()
+        pattern_files = []
+        gat = self.get_file_path(files, self.Gear.get_gat())
+        if gat:
+            checked.add(files.get_key(gat).lower())
+        for fileInfo in self.Gear.get_checklist():
+            path = self.get_file_path(files, fileInfo.get("file", ""))
+            if not path:
+                continue
+            checked.add(files.get_key(path).lower())
+            if fileInfo.get("pattern"):
+                pattern_files.append((path, fileInfo.get("pattern")))
+
+        unknown, unused = self.Gear.get_kit_report(pattern_files)
+
+        lines = ["-------- Mission kits ------"]
+        for name in sorted(unknown):
+            for file, line in unknown[name]:
+                lines.append("? {} ({}, line {})".format(name, file, line))
+                if file.lower() not in checked:
+                    self.reporter.error("   Kit [{}] from [{}] (line {}) is not defined!".format(name, file, line))
+                    self.reporter.review_error(9, name, file, line)
+        for name in unused:
+            file = self.Gear.kit_index.definition_files.get(name, "")
+            lines.append("- {} ({})".format(name, file))
+            self.reporter.review_info(3, name, file, self.Gear.kit_index.get_definition_line(name))
+
+        summary = "Unknown kits: {}, unused kits: {}".format(len(unknown), len(unused))
+        lines.append(summary)
+        try:
+            with open(os.path.join(self.output_dir, "Review.kits.log"), "w") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError:
+            self.reporter.error("Failed to write mission kits report!")
+        self.reporter.info("Kit references validated. " + summary)
+
+    @timed("Reviewer.review_tree")
+    def review_tree(self):
+        # Compares whole mission tree with reference index in one pass: added, removed and modified files.
+        # Files of different size are modified without reading them, files of the same size are hashed in parallel
+        # (unless hash is known from previous review). Edited files missing in Checklist are copied for review.
+        self.reporter.set_msg_prefix("(Tree)")
+        self.reporter.info("Comparing mission tree with reference")
+        reference = self.comparator.index.files
+        ref_keys = {key.lower(): key for key in reference}
+
+        added, modified, same_size = [], [], []
+        for key, path, size in self.target_files.list_files():
+            ref_key = ref_keys.pop(key.lower(), None)
+            if ref_key is None:
+                added.append(key)
+            elif size != reference[ref_key][0]:
+                modified.append((key, path))
+            else:
+                same_size.append((key, path, ref_key))
+        removed = sorted(ref_keys.values())
+
+        unknown = {path: key for key, path, _ in same_size if key not in self.file_hashes and key not in self.known_hashes}
+        for path, file_hash in hash_files(self.target_files.hash, list(unknown)).items():
+            self.file_hashes[unknown[path]] = file_hash
+        modified.extend((key, path) for key, path, ref_key in same_size if self.get_file_hash(key) != reference[ref_key][2])
+        modified.sort()
+
+        # Checklist files are already reported by checklist review
+        checklist = self.get_checklist_keys()
+        outside = [(key, path) for key, path in modified if key.lower() not in checklist]
+        for key, path in outside:
+            self.copy_reviewed_file(self.target_files, path, key)
+            self.reporter.review_warn(2, key)
+        for key in removed:
+            if key.lower() not in checklist:
+                self.reporter.review_warn(3, key)
+
+        lines = ["-------- Mission tree diff ------"]
+        lines.extend("+ " + key for key in sorted(added))
+        lines.extend("- " + key for key in removed)
+        lines.extend("* " + key for key, _ in modified)
+        summary = "Added: {}, removed: {}, modified: {} ({} outside checklist)".format(
+            len(added), len(removed), len(modified), len(outside)
+        )
+        lines.append(summary)
+        try:
+            with open(os.path.join(self.output_dir, "Review.tree.log"), "w") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError:
+            self.reporter.error("Failed to write mission tree diff!")
+        self.reporter.info("Mission tree compared. " + summary)
+
+    def get_checklist_keys(self):
+        # Returns: Normalized lowercase paths of all Checklist files (SET)
+        keys = set()
+        for list_name in self.REVIEW_LISTS:
+            for fileInfo in self.cfg.get(("Checklist", list_name)):
+                filename = fileInfo.get("file", "")
+                if self.tSF.check_is_shortcut(filename):
+                    filename = self.tSF.get_file(filename[6:])
+                keys.add(normalize_path(filename).lower())
+        return keys
+
+    def review_gat(self, gat):
+        # Checks that all kits from GAT exist
+        gat_kits = self.Gear.get_gat_kits(gat)
+        if not gat_kits:
+            self.reporter.error("Failed to find kits in Gear Assignment Table!")
+            self.reporter.review_error(5)
+            return
+
+        self.reporter.info("There are {} kits in GAT file.".format(len(gat_kits)))
+        key = self.target_files.get_key(gat)
+        for kit, line in gat_kits.items():
+            if self.Gear.check_kit_exists(kit):
+                self.reporter.info("    Kit {} exists.".format(kit))
+            else:
+                self.reporter.error("   Kit {} is missing!{}".format(kit, self.Gear.get_missing_kit_note(kit)))
+                self.reporter.review_error(6, kit, key, line)
+
+    def review_gear_file(self, file, pattern):
+        # Checks that all kits mentioned in file exist
+        kits_found = self.Gear.check_kit_in_file(file, pattern)
+        key = self.target_files.get_key(file)
+        if not kits_found:
+            self.reporter.error("Failed to find kits in [{}] file!".format(file))
+            self.reporter.review_error(8, key)
+            return
+
+        for kitInfo in kits_found:
+            kit_name = kitInfo.get("name")
+            if kitInfo.get("valid"):
+                self.reporter.info("    Kit [{}] exists (line {})".format(kit_name, kitInfo.get("line")))
+            else:
+                self.reporter.error("   Kit [{}] is missing in Kits.sqf (line {}){}".format(
+                    kit_name, kitInfo.get("line"), self.Gear.get_missing_kit_note(kit_name)
+                ))
+                self.reporter.review_error(7, kit_name, key, kitInfo.get("line"))
+
     def read_config(self, filename):
         # Check that config file exists and reads it data to dictionary
         # Returns: Dictionary or stops execution if none found
-        try:
-            return ConfigReader(filename)
-        except FileNotFoundError:
-            self.fatal_and_exit("Could not find config file [" + filename + "]!")
-        except ValueError:
-            self.fatal_and_exit("Could not read config file! File is malformed!")
+        cfg, error = load_config(filename)
+        if error:
+            self.fatal_and_exit(error)
+        return cfg
 
     def get_mission_dir(self):
-        # Prompt GitHub URL or full path to mission, then returns dir to mission if exists
-        # Returns: Mission directory or empty string, if not exists (STRING)
+        # Prompt GitHub URL or full path to mission, then returns access to mission files if exists.
+        # Downloaded mission is read straight from archive, without extracting it.
+        # Returns: Mission files (MissionFiles)
         msg = "GitHub repo URL or path to mission:"
-        url = input(msg)
+        url = self.mission or input(msg)
         while not url:
             print("Warning! Empty URL/path is given. Please, profive valid URL/path!")
             url = input(msg)
+        self.mission = url
 
         dir_path = ""
         if url.startswith("http"):
             self.reporter.info("Mission repo URL is provided. Downloading attemp...")
-            downloader = Downloader(self.reporter)
-            dir_path = downloader.download(url)
-            if not dir_path:
+            downloader = Downloader(
+                self.reporter, self.context.get_session() if self.context else None, self.output_dir, self.metrics,
+                self.get_archive_cache()
+            )
+            try:
+                self.archive = downloader.download_archive(url)
+            finally:
+                downloader.close()
+            if not self.archive:
                 self.fatal_and_exit("Repo URL is unreachable (non-existing?)!")
 
             self.reporter.info("Mission repo downloaded successfully")
+            try:
+                return ZipMissionFiles(self.archive)
+            except (OSError, BadZipFile):
+                self.fatal_and_exit("Downloaded mission archive is malformed!")
         else:
             self.reporter.info("Mission local path was provided. Checking...")
             dir_path = url
@@ -560,38 +2744,39 @@ class Reviewer:
                 self.fatal_and_exit("Local mission path is unreachable (non-existing?)!")
             self.reporter.info("Mission local path exists.")
 
-        # print(dir_path)
-        return dir_path
+        return MissionFiles(dir_path)
 
     def create_review_dir(self, name):
-        # Creates or re-creates review directory, removing all old files
-        dir_path = None
+        # Starts writing of review directory (or archive, if review_bundle is set), replacing old one on finish
+        # Returns: Path of review directory or archive (STRING)
         try:
-            if os.path.isdir(name):
-                shutil.rmtree(name)
-            os.mkdir(name)
-            dir_path = name
+            bundle = self.cfg.get("review_bundle").lower() == "true"
+        except ValueError:
+            bundle = False
+
+        try:
+            self.review_writer = ReviewWriter(name, bundle)
         except OSError:
             self.fatal_and_exit("Failed to create review directory!")
 
-        return dir_path
+        return self.review_writer.path
 
     def get_changed_file(self, filename, alert_identical):
         # Validates and compare file from target and reference dirs, reports state to log and review
         # Returns: Changed file path or empty string otherwise (STRING)
 
         self.reporter.info("Check file for difference [{}], alert?: {}".format(filename, alert_identical))
-        ref_file = self.get_file_path(self.ref_dir, filename)
+        ref_file = self.get_file_path(self.ref_files, filename)
         if not ref_file:
             self.reporter.review_error(1, filename)
             return ""
 
-        tgt_file = self.get_file_path(self.target_dir, filename)
+        tgt_file = self.get_file_path(self.target_files, filename)
         if not tgt_file:
             self.reporter.review_warn(1, filename)
             return ""
 
-        are_identical = self.comparator.compare(ref_file, tgt_file)
+        are_identical = self.comparator.compare(self.ref_files, ref_file, self.target_files, tgt_file)
         if are_identical:
             if alert_identical:
                 self.reporter.review_error(2, filename)
@@ -601,61 +2786,900 @@ class Reviewer:
 
         return tgt_file
 
-    def get_file_path(self, target_dir, filename):
+    def get_file_path(self, files, filename):
         # Returns: Path to file or empty string, if file not exists (STRING)
-
-        # print("\n## Get File Path invoked ##")
-        # print("Init filename: " + filename)
         if self.tSF.check_is_shortcut(filename):
             filename = self.tSF.get_file(filename[6:])
-        path = os.path.join(target_dir, filename)
 
-        # print("Target dir: " + target_dir)
-        # print("File: " + filename)
-        # print("# Path: " + path)
-        # print()
+        return files.get_path(filename)
 
-        if not os.path.isfile(path):
-            return ""
-        return path
-
-    def copy_reviewed_file(self, path, file, to):
+    def copy_reviewed_file(self, files, path, file):
         # Copies and renames given file to format Dir1_Dir2_DirN_Filename
-        new_name = os.path.join(to, "_".join(file.split(os.sep)))
+        new_name = "_".join(normalize_path(file).split("/"))
+        if self.copies is not None:
+            self.copies.append(file)
+        self.copied[new_name] = self.get_input_key(file)
+        if new_name in self.kept_copies:
+            # Copy made by previous run of watch mode is still actual
+            return
 
-        self.reporter.info("-- Copy changed file -- from {} to {}".format(path, new_name))
+        self.reporter.info("-- Copy changed file -- from {} to {}".format(path, os.path.join(self.review_dir, new_name)))
         try:
-            shutil.copyfile(path, new_name)
+            self.review_writer.add(files, path, new_name)
         except:
             self.reporter.error("Failed to copy file {} to review directory".format(path))
+        self.write_reviewed_diff(files, path, file, new_name)
+
+    def write_reviewed_diff(self, files, path, file, new_name):
+        # Writes unified diff of edited file against reference next to its copy (Dir1_Dir2_Filename.diff)
+        ref_path = self.get_file_path(self.ref_files, file)
+        if not ref_path:
+            return
+
+        diff = self.comparator.diff(self.ref_files, ref_path, files, path, normalize_path(file))
+        if not diff:
+            if self.review_writer.in_place:
+                self.review_writer.remove(new_name + ".diff")
+            return
+        self.reporter.info("-- Diff against reference -- {} lines added, {} removed".format(
+            sum(1 for line in diff[2:] if line.startswith("+")), sum(1 for line in diff[2:] if line.startswith("-"))
+        ))
+        try:
+            self.review_writer.add_text(new_name + ".diff", "\n".join(diff) + "\n")
+        except OSError:
+            self.reporter.error("Failed to write diff of file {} to review directory".format(path))
+
+    def close(self):
+        # Releases mission files and logs, review which was not finished is dropped.
+        # Downloaded archive is removed (archive cache keeps its own copy).
+        if self.review_writer:
+            self.review_writer.abort()
+        if self.target_files:
+            self.target_files.close()
+        if self.archive:
+            with contextlib.suppress(OSError):
+                os.remove(self.archive)
+            self.archive = None
+        self.reporter.close()
 
     def fatal_and_exit(self, msg):
         # Reports Fatal error and stops execution
         self.reporter.fatal(msg)
+        self.close()
         sys.exit(msg)
 
 
 class Comparator:
+    DIFF_CONTEXT = 3
+    # Edit distance, beyond which changed part of file is reported as replaced as a whole
+    DIFF_MAX_EDITS = 1000
+    # Files with NUL bytes in their head are binary and are not diffed
+    BINARY_PROBE_SIZE = 8000
+
+    def __init__(self, index=None, metrics=NO_METRICS):
+        self.index = index
+        self.metrics = metrics
+
+    @timed("Comparator.compare", file_arg=3)
+    def compare(self, ref_files, ref_file, review_files, review_file):
+        # Compares file content, reading files from directory or archive.
+        # Reference files known to index are compared by precomputed size and hash, only reviewed file is read.
+        # Content hashes are memoized by file cache, so file hashed by other check is not read again.
+        # Returns: True if files are identical (BOOL)
+        ref_entry = self.index.get(ref_file) if self.index and ref_files.root == self.index.root else None
+        if ref_entry:
+            ref_size, ref_hash = ref_entry
+            if ref_size != review_files.size(review_file):
+                return False
+            return review_files.hash(review_file) == ref_hash
+
+        if ref_files.size(ref_file) != review_files.size(review_file):
+            return False
+        return ref_files.hash(ref_file) == review_files.hash(review_file)
+
+    @timed("Comparator.diff", file_arg=3)
+    def diff(self, ref_files, ref_file, review_files, review_file, name):
+        # Returns: Unified diff of reviewed file against reference, empty for identical, binary or large files (LIST)
+        for files, path in ((ref_files, ref_file), (review_files, review_file)):
+            if not files.cache.can_hold(files.size(path)) or b"\0" in files.read(path)[:self.BINARY_PROBE_SIZE]:
+                return []
+
+        a = ref_files.read_text(ref_file).splitlines()
+        b = review_files.read_text(review_file).splitlines()
+        lines = []
+        for group in self.group_opcodes(self.get_opcodes(a, b)):
+            lines.append("@@ -{} +{} @@".format(
+                self.format_range(group[0][1], group[-1][2]), self.format_range(group[0][3], group[-1][4])
+            ))
+            for tag, i1, i2, j1, j2 in group:
+                if tag == "equal":
+                    lines.extend(" " + line for line in a[i1:i2])
+                else:
+                    lines.extend("-" + line for line in a[i1:i2])
+                    lines.extend("+" + line for line in b[j1:j2])
+
+        if not lines:
+            return []
+        return ["--- reference/" + name, "+++ mission/" + name] + lines
+
+    def get_opcodes(self, a, b):
+        # Line-hash pre-pass: lines are interned to numbers and common prefix and suffix are skipped by comparing
+        # numbers, only the rest is diffed by Myers algorithm.
+        # Returns: Opcodes in difflib form - [tag, i1, i2, j1, j2], tag is "equal" or "replace" (LIST)
+        ids = {}
+        a = [ids.setdefault(line, len(ids)) for line in a]
+        b = [ids.setdefault(line, len(ids)) for line in b]
+        n, m = len(a), len(b)
+
+        prefix = 0
+        while prefix < n and prefix < m and a[prefix] == b[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < n - prefix and suffix < m - prefix and a[n - 1 - suffix] == b[m - 1 - suffix]:
+            suffix += 1
+
+        opcodes = [["equal", 0, prefix, 0, prefix]] if prefix else []
+        a, b = a[prefix:n - suffix], b[prefix:m - suffix]
+        # Every line missing in the other file is an edit, so such lines bound edit distance from below
+        a_lines, b_lines = set(a), set(b)
+        missing = sum(1 for line in a if line not in b_lines) + sum(1 for line in b if line not in a_lines)
+        steps = self.myers(a, b, self.DIFF_MAX_EDITS) if missing <= self.DIFF_MAX_EDITS else None
+        if steps is None:
+            opcodes.append(["replace", prefix, n - suffix, prefix, m - suffix])
+        else:
+            for tag, i, j in steps:
+                i, j = i + prefix, j + prefix
+                di, dj = int(tag != "insert"), int(tag != "delete")
+                if opcodes and (opcodes[-1][0] == "equal") == (tag == "equal"):
+                    opcodes[-1][2] += di
+                    opcodes[-1][4] += dj
+                else:
+                    opcodes.append(["equal" if tag == "equal" else "replace", i, i + di, j, j + dj])
+        if suffix:
+            opcodes.append(["equal", n - suffix, n, m - suffix, m])
+        return opcodes
+
+    @staticmethod
+    def myers(a, b, max_edits):
+        # Myers shortest edit script, O((N+M)D) time
+        # Returns: Edit steps (tag, i, j) in file order or None, if edit distance exceeds max_edits (LIST)
+        n, m = len(a), len(b)
+        max_d = min(n + m, max_edits)
+        offset = max_d + 1
+        v = [0] * (2 * max_d + 3)
+        trace = []
+        for d in range(max_d + 1):
+            # Furthest points of previous round for diagonals -d-1..d+1, needed to backtrack this round
+            trace.append(v[offset - d - 1:offset + d + 2])
+            for k in range(-d, d + 1, 2):
+                if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                    x = v[offset + k + 1]
+                else:
+                    x = v[offset + k - 1] + 1
+                y = x - k
+                while x < n and y < m and a[x] == b[y]:
+                    x += 1
+                    y += 1
+                v[offset + k] = x
+                if x >= n and y >= m:
+                    return Comparator.backtrack(trace, n, m)
+        return None
+
+    @staticmethod
+    def backtrack(trace, n, m):
+        # Returns: Edit steps from Myers trace - ("equal", i, j), ("delete", i, j) or ("insert", i, j) (LIST)
+        steps = []
+        x, y = n, m
+        for d in range(len(trace) - 1, -1, -1):
+            v = trace[d]
+            k = x - y
+            if k == -d or (k != d and v[k + d] < v[k + d + 2]):
+                prev_k = k + 1
+            else:
+                prev_k = k - 1
+            prev_x = v[prev_k + d + 1]
+            prev_y = prev_x - prev_k
+
+            while x > prev_x and y > prev_y:
+                x -= 1
+                y -= 1
+                steps.append(("equal", x, y))
+            if d > 0:
+                steps.append(("insert" if x == prev_x else "delete", prev_x, prev_y))
+            x, y = prev_x, prev_y
+
+        steps.reverse()
+        return steps
+
+    def group_opcodes(self, opcodes):
+        # Splits opcodes to hunks with DIFF_CONTEXT lines of context (as difflib.SequenceMatcher.get_grouped_opcodes)
+        # Yields: Opcodes of hunk (LIST)
+        n = self.DIFF_CONTEXT
+        if not opcodes or (len(opcodes) == 1 and opcodes[0][0] == "equal"):
+            return
+        opcodes = [list(code) for code in opcodes]
+        if opcodes[0][0] == "equal":
+            tag, i1, i2, j1, j2 = opcodes[0]
+            opcodes[0] = [tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2]
+        if opcodes[-1][0] == "equal":
+            tag, i1, i2, j1, j2 = opcodes[-1]
+            opcodes[-1] = [tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)]
+
+        group = []
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag == "equal" and i2 - i1 > 2 * n:
+                group.append([tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)])
+                yield group
+                group = []
+                i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+            group.append([tag, i1, i2, j1, j2])
+        if group and not (len(group) == 1 and group[0][0] == "equal"):
+            yield group
+
+    @staticmethod
+    def format_range(start, stop):
+        # Returns: Hunk range in unified diff form - 1-based "start,length" (STRING)
+        beginning = start + 1
+        length = stop - start
+        if length == 1:
+            return str(beginning)
+        if not length:
+            beginning -= 1
+        return "{},{}".format(beginning, length)
+
+
+def review_mission(mission, output_dir, quiet=True, metrics="", context=None, tree=False):
+    # Batch and service worker: reviews single mission in its own output directory
+    # Returns: Review summary (DICT)
+    started = time.time()
+    reviewer = Reviewer(mission, output_dir, quiet, metrics, context, tree)
+    status = "OK"
+    try:
+        reviewer.run()
+    except SystemExit as e:
+        status = "FAILED: {}".format(e)
+    except Exception as e:
+        reviewer.reporter.fatal("Unexpected error: {}".format(e))
+        status = "FAILED: {}".format(e)
+    finally:
+        reviewer.close()
+
+    return {
+        "mission": mission,
+        "output": output_dir,
+        "status": status,
+        "errors": reviewer.reporter.counters["ERR"],
+        "warnings": reviewer.reporter.counters["WRN"],
+        "findings": reviewer.reporter.records,
+        "checks": reviewer.run_checks,
+        "reused": reviewer.reused_checks,
+        "new": reviewer.delta[0],
+        "resolved": reviewer.delta[1],
+        "time": time.time() - started
+    }
+
+
+def get_failed_result(mission, output_dir, error):
+    # Returns: Summary of review, which failed without result of its own (DICT)
+    return {
+        "mission": mission, "output": output_dir, "status": "FAILED: {}".format(error or type(error).__name__),
+        "errors": 0, "warnings": 0, "findings": [], "checks": [], "reused": 0, "new": [], "resolved": [], "time": 0.0
+    }
+
+
+def get_job_dir_name(index, mission):
+    # Returns: Job directory name in format NN_MissionName (STRING)
+    name = re.sub(r'[^\w.\-]+', "_", mission.rstrip("/\\").replace("\\", "/").rsplit("/", 1)[-1])
+    return "{:02d}_{}".format(index, name)
+
+
+def format_summary(results):
+    # Returns: Summary table of batch review (STRING)
+    row = "{:<40} | {:>6} | {:>8} | {:>7} | {}"
+    lines = [row.format("Mission", "Errors", "Warnings", "Time, s", "Status"), "-" * 90]
+    for result in results:
+        lines.append(row.format(
+            result["mission"][-40:], result["errors"], result["warnings"], "{:.1f}".format(result["time"]), result["status"]
+        ))
+    return "\n".join(lines)
+
+
+def run_batch(missions, output_dir, workers, quiet=True, metrics="", tree=False):
+    # Reviews missions in pool of worker processes, each job in its own output_dir/NN_MissionName directory.
+    # Downloads of some jobs overlap with reviews of others.
+    # Returns: List of review summaries in given missions order (LIST)
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Warm reference manifests once, so workers only load them
+    cfg, error = load_config("config.yaml")
+    if error:
+        sys.exit(error)
+    ReferenceVersions.from_config(cfg)
+
+    results = [None] * len(missions)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = {
+            pool.submit(review_mission, mission, os.path.join(output_dir, get_job_dir_name(i + 1, mission)), quiet, metrics, None, tree): i
+            for i, mission in enumerate(missions)
+        }
+        for job in as_completed(jobs):
+            i = jobs[job]
+            try:
+                results[i] = job.result()
+            except Exception as e:
+                # Worker crashed (or its result can't be passed back), other jobs and summary go on
+                results[i] = get_failed_result(
+                    missions[i], os.path.join(output_dir, get_job_dir_name(i + 1, missions[i])), e
+                )
+            print("[{}/{}] {} - {}".format(i + 1, len(missions), missions[i], results[i]["status"]))
+
+    summary = format_summary(results)
+    print(summary)
+    with open(os.path.join(output_dir, "summary.log"), "w") as f:
+        f.write(summary + "\n")
+
+    return results
+
+
+def read_missions_list(filename):
+    # Returns: Missions URLs/paths from file, one per line, skipping empty lines and # comments (LIST)
+    with open(filename, "r") as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+
+
+class ReviewContext:
+    """
+        Warm state shared by reviews of review service: parsed config, compiled patterns, reference versions and
+        HTTP session, so connections to GitHub are reused by downloads of all jobs.
+        State is reloaded when config file changes. Otherwise reference indexes are re-validated by stat of reference
+        trees on every refresh, so updated reference files are re-hashed before the next review.
+    """
+
+    def __init__(self, config_name="config.yaml"):
+        self.config_name = config_name
+        self.lock = threading.Lock()
+        self.cfg = None
+        self.config_hash = ""
+        self.references = None
+        self.stamp = None
+        self.session = None
+        self.load()
+
+    def get_session(self):
+        # Returns: HTTP session shared by downloaders of all reviews (requests.Session)
+        with self.lock:
+            if self.session is None:
+                import requests
+                self.session = requests.Session()
+            return self.session
+
+    def close(self):
+        with self.lock:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
+
+    def get_stamp(self):
+        stat = os.stat(self.config_name)
+        return stat.st_size, stat.st_mtime_ns
+
+    def load(self):
+        cfg = ConfigReader(self.config_name)
+        with open(self.config_name, "rb") as f:
+            config_hash = hash_stream(f)
+        references = ReferenceVersions.from_config(cfg)
+
+        self.cfg, self.config_hash, self.references, self.stamp = cfg, config_hash, references, self.get_stamp()
+
+    def refresh(self, force=False):
+        # Returns: Config, config hash and reference versions, reloaded if config was changed (TUPLE)
+        with self.lock:
+            if force or self.get_stamp() != self.stamp:
+                self.load()
+            else:
+                self.references = self.references.refresh()
+            return self.cfg, self.config_hash, self.references
+
+
+
+
+class ReviewService:
+    """
+        Resident review service: keeps ReviewContext warm and runs queued review jobs on pool of worker threads.
+        Each job is reviewed in its own output_dir/NNNN_MissionName directory, as in batch mode.
+    """
+
+    JOB_HISTORY = 1000
+
+    def __init__(self, output_dir, workers, config_name="config.yaml"):
+        from concurrent.futures import ThreadPoolExecutor
+        os.makedirs(output_dir, exist_ok=True)
+
+        self.output_dir = output_dir
+        self.workers = workers
+        self.context = ReviewContext(config_name)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.futures = {}
+        self.last_id = 0
+        self.started = time.time()
+
+    def submit(self, mission, metrics="", tree=False):
+        # Returns: Queued job (DICT)
+        with self.lock:
+            self.last_id += 1
+            job = {"id": self.last_id, "mission": mission, "status": "queued", "submitted": time.time(), "result": None}
+            self.jobs[job["id"]] = job
+            self.prune()
+
+        output = os.path.join(self.output_dir, get_job_dir_name(job["id"], mission))
+        self.futures[job["id"]] = self.pool.submit(self.run_job, job, output, metrics, tree)
+        return job
+
+    def run_job(self, job, output, metrics, tree):
+        job["status"] = "running"
+        job["result"] = review_mission(job["mission"], output, True, metrics, self.context, tree)
+        job["status"] = "done"
+
+    def prune(self):
+        # Forgets oldest finished jobs, so memory use doesn't grow with service uptime
+        finished = [job_id for job_id, job in self.jobs.items() if job["status"] == "done"]
+        for job_id in finished[:max(0, len(self.jobs) - self.JOB_HISTORY)]:
+            del self.jobs[job_id]
+            self.futures.pop(job_id, None)
+
+    def get(self, job_id):
+        # Returns: Job or None (DICT)
+        return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        # Returns: Known jobs, oldest first (LIST)
+        with self.lock:
+            return list(self.jobs.values())
+
+    def wait(self, job_id, timeout=None):
+        # Returns: Job, finished unless timeout is reached (DICT)
+        future = self.futures.get(job_id)
+        if future:
+            try:
+                future.result(timeout)
+            except Exception:
+                pass
+        return self.get(job_id)
+
+    def reload(self):
+        self.context.refresh(force=True)
+
+    def get_status(self):
+        # Returns: Service state (DICT)
+        with self.lock:
+            jobs = Counter(job["status"] for job in self.jobs.values())
+        return {
+            "workers": self.workers,
+            "uptime": time.time() - self.started,
+            "jobs": dict(jobs),
+            "references": {name: len(index.files) for name, index in self.context.references.indexes.items()}
+        }
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        self.context.close()
+
+
+def create_service_handler(service):
+    # HTTP API of review service:
+    #   POST /reviews {"mission": URL or path, "metrics": "jsonl"|"prom", "tree": bool, "wait": bool} - queue review job
+    #   GET /reviews, GET /reviews/<id> - jobs and their results, GET /status - service state, POST /reload - reload config
+    import http.server
+
+    class ReviewRequestHandler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            path = self.path.split("?")[0].rstrip("/")
+            if path == "/status":
+                self.send_json(200, service.get_status())
+            elif path == "/reviews":
+                self.send_json(200, service.list_jobs())
+            elif path.startswith("/reviews/") and service.get(self.get_job_id(path)):
+                self.send_json(200, service.get(self.get_job_id(path)))
+            elif path.startswith("/reviews/"):
+                self.send_json(404, {"error": "Job not found"})
+            else:
+                self.send_json(404, {"error": "Unknown endpoint"})
+
+        def do_POST(self):
+            path = self.path.split("?")[0].rstrip("/")
+            if path == "/reload":
+                service.reload()
+                self.send_json(200, service.get_status())
+                return
+            if path != "/reviews":
+                self.send_json(404, {"error": "Unknown endpoint"})
+                return
+
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            except ValueError:
+                request = None
+            if not isinstance(request, dict):
+                self.send_json(400, {"error": "Request body is not valid JSON object"})
+                return
+
+            mission = request.get("mission")
+            metrics = request.get("metrics") or ""
+            if not mission or not isinstance(mission, str):
+                self.send_json(400, {"error": "Mission URL or path is required"})
+            elif metrics and metrics not in Metrics.FORMATS:
+                self.send_json(400, {"error": "Unknown metrics format [{}]".format(metrics)})
+            else:
+                job = service.submit(mission, metrics, bool(request.get("tree")))
+                if request.get("wait"):
+                    self.send_json(200, service.wait(job["id"]))
+                else:
+                    self.send_json(202, job)
+
+        @staticmethod
+        def get_job_id(path):
+            try:
+                return int(path.rsplit("/", 1)[1])
+            except ValueError:
+                return None
+
+        def send_json(self, code, data):
+            body = json.dumps(data).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return ReviewRequestHandler
+
+
+def run_service(output_dir, workers, host="127.0.0.1", port=8765, socket_path=""):
+    # Serves review API on local TCP port or Unix socket until interrupted
+    import http.server
+    import socketserver
+    service = ReviewService(output_dir, workers)
+    handler = create_service_handler(service)
+
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = socketserver.ThreadingUnixStreamServer(socket_path, handler)
+        address = socket_path
+    else:
+        server = http.server.ThreadingHTTPServer((host, port), handler)
+        address = "http://{}:{}".format(host, server.server_address[1])
+    server.daemon_threads = True
+
+    print("Review service is listening on {} ({} workers, {} reference versions)".format(
+        address, workers, len(service.context.references.indexes)
+    ))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+class MissionWatcher:
+    """
+        Waits for changes of files in local mission directory. Uses inotify on Linux; on other systems, or if inotify
+        is not available, directory tree is polled for changed file stamps (size and modification time).
+        Hidden files and directories (.git, editor swap files) and ignored paths are not watched. Ignored path also
+        covers its siblings with extra suffix (path Review ignores Review.log, Review.json, Review.zip, ...).
+        Inotify mode keeps keys of watched files, so files of directory moved out or deleted are reported as changed.
+    """
+
+    POLL_INTERVAL = 0.5
+    # Changes made within this time after previous one are reported together (editors save file in several steps)
+    SETTLE_TIME = 0.1
+
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, root, ignore=()):
+        self.root = os.path.abspath(root)
+        self.ignore = [os.path.abspath(path) for path in ignore]
+        self.libc = None
+        self.fd = -1
+        self.watches = {}
+        self.stamps = {}
+        self.keys = set()
+        if self.start_inotify():
+            self.mode = "inotify"
+            self.keys = set(self.scan())
+        else:
+            self.mode = "polling"
+            self.stamps = self.scan()
+
+    def start_inotify(self):
+        # Returns: True if inotify watches are set for all mission directories (BOOL)
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            import ctypes
+            import ctypes.util
+            self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if self.fd < 0:
+                return False
+            self.add_watches(self.root)
+        except (OSError, AttributeError):
+            self.close()
+            return False
+        return True
+
+    def add_watches(self, directory):
+        for path in [directory] + [path for path, entry in self.walk(directory) if entry.is_dir()]:
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.WATCH_MASK)
+            if wd < 0:
+                raise OSError("Failed to watch [{}]".format(path))
+            self.watches[wd] = path
+
+    def is_ignored(self, path):
+        return os.path.basename(path).startswith(".") or any(
+            path == ignored or path.startswith((ignored + os.sep, ignored + ".")) for ignored in self.ignore
+        )
+
+    def walk(self, directory):
+        # Yields: (path, DirEntry) of every not ignored file and directory in directory tree
+        try:
+            with os.scandir(directory) as entries:
+                entries = list(entries)
+        except OSError:
+            return
+        for entry in entries:
+            if self.is_ignored(entry.path):
+                continue
+            yield entry.path, entry
+            if entry.is_dir(follow_symlinks=False):
+                yield from self.walk(entry.path)
+
+    def scan(self):
+        # Returns: Stamps of all watched files (DICT of relative paths to (size, mtime))
+        stamps = {}
+        for path, entry in self.walk(self.root):
+            if entry.is_file():
+                stat = entry.stat()
+                stamps[self.get_key(path)] = (stat.st_size, stat.st_mtime_ns)
+        return stamps
+
+    def get_key(self, path):
+        return normalize_path(os.path.relpath(path, self.root))
+
+    def wait(self, timeout=None):
+        # Blocks until mission files change, then collects changes until files settle down
+        # Returns: Changed files as normalized paths relative to mission root (SET), empty set on timeout
+        read_changes = self.read_events if self.mode == "inotify" else self.poll
+        deadline = None if timeout is None else time.time() + timeout
+        changed = set()
+        while not changed:
+            # Events of ignored files wake watcher up too, so waiting goes on until timeout
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                return changed
+            changed = read_changes(remaining)
+        while changed:
+            more = read_changes(self.SETTLE_TIME)
+            if not more:
+                break
+            changed |= more
+        return changed
+
+    def read_events(self, timeout):
+        # Returns: Files changed according to inotify events within timeout (SET)
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset + self.EVENT.size <= len(data):
+            wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+            name = data[offset + self.EVENT.size:offset + self.EVENT.size + length].split(b"\0", 1)[0]
+            offset += self.EVENT.size + length
+
+            if mask & self.IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            if not directory or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if self.is_ignored(path):
+                continue
 
-    def compare(self, ref_file, review_file):
-        return filecmp.cmp(ref_file, review_file)
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    # Files of new directory may be written before its watch is set
+                    try:
+                        self.add_watches(path)
+                    except OSError:
+                        pass
+                    keys = {self.get_key(p) for p, entry in self.walk(path) if entry.is_file()}
+                    self.keys |= keys
+                    changed |= keys
+                elif mask & (self.IN_MOVED_FROM | self.IN_DELETE):
+                    self.remove_watches(path)
+                    prefix = self.get_key(path) + "/"
+                    keys = {key for key in self.keys if key.startswith(prefix)}
+                    self.keys -= keys
+                    changed |= keys
+                continue
+
+            key = self.get_key(path)
+            if mask & (self.IN_MOVED_FROM | self.IN_DELETE):
+                self.keys.discard(key)
+            else:
+                self.keys.add(key)
+            changed.add(key)
+        return changed
+
+    def remove_watches(self, directory):
+        # Drops watches of directory moved out of its place, its events would be reported under old path
+        for wd, path in list(self.watches.items()):
+            if path == directory or path.startswith(directory + os.sep):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+
+    def poll(self, timeout):
+        # Returns: Files changed since previous scan, found within timeout (SET)
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            delay = self.POLL_INTERVAL if deadline is None else max(0, min(self.POLL_INTERVAL, deadline - time.time()))
+            time.sleep(delay)
+            stamps = self.scan()
+            changed = {key for key in stamps.keys() | self.stamps.keys() if stamps.get(key) != self.stamps.get(key)}
+            self.stamps = stamps
+            if changed or (deadline is not None and time.time() >= deadline):
+                return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def get_watch_ignore(cfg, mission, output_dir):
+    # Review output written inside of mission must not trigger re-review. Output directory nested in mission is
+    # ignored as a whole; if output goes to mission root, only review artifacts are (not the whole mission).
+    # Returns: Paths of review artifacts in mission directory (LIST)
+    root = os.path.abspath(mission)
+    output = os.path.abspath(output_dir or ".")
+    if output == root:
+        names = {"log.log", "metrics", "Review", cfg.get("review_directory_name")}
+        ignore = [os.path.join(output, name) for name in sorted(names)]
+    else:
+        ignore = [output]
+    ignore.extend(os.path.abspath(path) for path in (cfg.get("review_cache"), "config.yaml" + ConfigReader.CACHE_SUFFIX))
+    return [path for path in ignore if path != root and os.path.commonpath([path, root]) == root]
+
+
+def run_watch(mission, output_dir="", metrics="", tree=False):
+    # Watch mode: reviews local mission, then updates the review on every change of its files until interrupted.
+    # Reviewer is kept between runs: only changed files are re-read and re-indexed, and only checklist entries,
+    # module toggles and gear checks affected by changed files are run again - others replay previous findings.
+    if mission.startswith("http") or not os.path.isdir(mission):
+        print("Watch mode requires path to local mission directory!")
+        return
+
+    reviewer = Reviewer(mission, output_dir, True, metrics, None, tree)
+    watcher = None
+    try:
+        started = time.time()
+        try:
+            reviewer.run()
+        except SystemExit as e:
+            print("Review failed: {}".format(e))
+            return
+        print_watch_status(reviewer, "OK", time.time() - started)
+
+        watcher = MissionWatcher(mission, get_watch_ignore(reviewer.cfg, mission, output_dir))
+        print("Watching {} for changes ({}), press Ctrl+C to stop".format(mission, watcher.mode))
+        while True:
+            changed = watcher.wait()
+            print("Changed: " + ", ".join(sorted(changed)))
+            started = time.time()
+            status = "OK"
+            try:
+                reviewer.update(changed)
+            except SystemExit as e:
+                status = "FAILED: {}".format(e)
+            except Exception as e:
+                reviewer.reporter.fatal("Unexpected error: {}".format(e))
+                reviewer.review_writer.abort()
+                status = "FAILED: {}".format(e)
+            print_watch_status(reviewer, status, time.time() - started)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if watcher:
+            watcher.close()
+        reviewer.close()
+
+
+def print_watch_status(reviewer, status, duration):
+    # Prints result of watch mode review run with findings added and resolved since previous run
+    counters = reviewer.reporter.counters
+    print("[{}] {} - errors: {}, warnings: {}, {:.2f} s".format(
+        time.strftime("%H:%M:%S"), status, counters["ERR"], counters["WRN"], duration
+    ))
+    print("    Checks run: {}, reused: {}".format(", ".join(reviewer.run_checks) or "none", reviewer.reused_checks))
+    for line in reviewer.delta[0]:
+        print("    + " + line)
+    for line in reviewer.delta[1]:
+        print("    - " + line)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="tSF Review Helper")
+    parser.add_argument("missions", nargs="*", help="GitHub repo URLs or paths to missions (batch review)")
+    parser.add_argument("-l", "--list", help="File with missions URLs/paths, one per line (batch review)")
+    parser.add_argument(
+        "-o", "--output",
+        help="Output directory of batch review and service (default BatchReview) or watch mode (default current directory)"
+    )
+    parser.add_argument("-w", "--workers", type=int, default=min(4, os.cpu_count() or 1), help="Number of review workers")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Don't print log messages to console")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print batch workers log messages to console")
+    parser.add_argument("-m", "--metrics", choices=sorted(Metrics.FORMATS), help="Export stage timings next to Review.log")
+    parser.add_argument("-t", "--tree", action="store_true", help="Compare whole mission tree with reference")
+    parser.add_argument("-d", "--daemon", action="store_true", help="Run review service with HTTP API")
+    parser.add_argument("--host", default="127.0.0.1", help="Review service host")
+    parser.add_argument("--port", type=int, default=8765, help="Review service port")
+    parser.add_argument("--socket", default="", help="Serve review service on Unix socket instead of TCP port")
+    parser.add_argument("--watch", action="store_true", help="Re-review local mission on every change of its files")
+    return parser.parse_args()
 
 
 def main():
     print("Start")
+    args = parse_args()
+
+    if args.daemon:
+        run_service(args.output or "BatchReview", max(1, args.workers), args.host, args.port, args.socket)
+        return
+
+    missions = list(args.missions)
+    if args.list:
+        missions.extend(read_missions_list(args.list))
 
-    reviewer = Reviewer()
-    reviewer.prepare()
-    reviewer.review("Core")
-    reviewer.review("Dynai")
-    reviewer.review("Gear")
-    reviewer.review("tSF")
-    reviewer.review("tSF_modules")
-    reviewer.review_gear()
+    if args.watch:
+        run_watch(missions[0] if missions else input("Path to mission:"), args.output or "", args.metrics or "", args.tree)
+        return
+
+    if missions:
+        run_batch(missions, args.output or "BatchReview", max(1, args.workers), not args.verbose, args.metrics or "", args.tree)
+        return
+
+    reviewer = Reviewer(quiet=args.quiet, metrics=args.metrics or "", tree=args.tree)
+    reviewer.run()
+    reviewer.close()
 
 
 if __name__ == "__main__":
     main()
-
-print("Done")
+    print("Done")
 